@@ -0,0 +1,86 @@
+import numpy as np
+
+
+def csr_index(parent_keys, child_parent_keys):
+    # parent -> children offsets (CSR), built once with a single sort of the children
+    # results of the reductions are aligned with parent_keys, children without a known parent are ignored
+    parent_keys = np.asarray(parent_keys)
+    child_parent_keys = np.asarray(child_parent_keys)
+    n_parents, n_children = len(parent_keys), len(child_parent_keys)
+
+    # parent of every child as a position in parent_keys, -1 for unknown parents
+    parent = np.full(n_children, -1, dtype=np.int64)
+    if n_parents:
+        parent_order = np.argsort(parent_keys, kind="stable")
+        sorted_keys = parent_keys[parent_order]
+        positions = np.searchsorted(sorted_keys, child_parent_keys).clip(0, n_parents - 1)
+        valid = sorted_keys[positions] == child_parent_keys
+        parent[valid] = parent_order[positions[valid]]
+
+    children = np.flatnonzero(parent >= 0)
+    counts = np.bincount(parent[children], minlength=n_parents)
+    return {
+        "parent": parent,
+        "order": children[np.argsort(parent[children], kind="stable")],
+        "counts": counts,
+        "offsets": np.concatenate([[0], np.cumsum(counts)]),
+    }
+
+
+def _reduce(index, ufunc, values, empty, dtype=None):
+    # ufunc over the children of every parent, empty for parents without children
+    sorted_values = np.asarray(values, dtype=dtype)[index["order"]]
+    result = np.full(len(index["counts"]), empty, dtype=np.result_type(sorted_values.dtype, np.asarray(empty).dtype))
+    non_empty = index["counts"] > 0
+    if non_empty.any():
+        result[non_empty] = ufunc.reduceat(sorted_values, index["offsets"][:-1][non_empty])
+    return result
+
+
+def any_over_children(index, values):
+    return _reduce(index, np.logical_or, values, False, dtype=bool)
+
+
+def all_over_children(index, values):
+    return _reduce(index, np.logical_and, values, True, dtype=bool)
+
+
+def sum_over_children(index, values):
+    return _reduce(index, np.add, values, 0)
+
+
+def max_over_children(index, values):
+    # NaN-ignoring, NaN for parents without children
+    return _reduce(index, np.fmax, values, np.nan, dtype=np.float64)
+
+
+def min_over_children(index, values):
+    return _reduce(index, np.fmin, values, np.nan, dtype=np.float64)
+
+
+def first_over_children(index, values, empty=None):
+    # value of the first child (in input order) of every parent
+    values = np.asarray(values)
+    dtype = object if empty is None else np.result_type(values.dtype, np.asarray(empty).dtype)
+    result = np.full(len(index["counts"]), empty, dtype=dtype)
+    non_empty = index["counts"] > 0
+    result[non_empty] = values[index["order"][index["offsets"][:-1][non_empty]]]
+    return result
+
+
+def to_children(index, per_parent, empty=False):
+    # parent value for every child, in child input order
+    per_parent = np.asarray(per_parent)
+    result = np.full(len(index["parent"]), empty, dtype=np.result_type(per_parent.dtype, np.asarray(empty).dtype))
+    known = index["parent"] >= 0
+    result[known] = per_parent[index["parent"][known]]
+    return result
+
+
+def incident_adjacency(incident_ids, df_participants, df_passengers):
+    # incident -> vehicles -> passengers from zzz_participants / zzz_passengers
+    return {
+        "incident_vehicles": csr_index(incident_ids, df_participants["incident_id"].to_numpy()),
+        "vehicle_passengers": csr_index(df_participants["vehicle_id"].to_numpy(), df_passengers["vehicle_id"].to_numpy()),
+        "incident_passengers": csr_index(incident_ids, df_passengers["incident_id"].to_numpy()),
+    }
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+from sklearn.base import clone
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import HalvingRandomSearchCV
+from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.pipeline import make_pipeline
+
+from model_zoo import MODELS, PREPROCESSING, thread_budget
+
+
+# search spaces for the tree and boosting models, n_estimators is the successive halving resource
+SEARCH_SPACES = {
+    "Random Forest": {
+        "max_depth": [None, 4, 6, 8, 12],
+        "min_samples_leaf": [1, 2, 4, 8],
+        "max_features": [1.0, 0.7, 0.5, "sqrt"],
+    },
+    "Gradient Boosting": {
+        "learning_rate": [0.01, 0.03, 0.1, 0.3],
+        "max_depth": [2, 3, 4, 6],
+        "subsample": [0.6, 0.8, 1.0],
+        "min_samples_leaf": [1, 3, 5],
+    },
+    "XGBoost": {
+        "learning_rate": [0.01, 0.03, 0.1, 0.3],
+        "max_depth": [2, 3, 4, 6],
+        "subsample": [0.6, 0.8, 1.0],
+        "colsample_bytree": [0.6, 0.8, 1.0],
+        "min_child_weight": [1, 3, 5],
+    },
+    "LightGBM": {
+        "learning_rate": [0.01, 0.03, 0.1, 0.3],
+        "num_leaves": [4, 8, 16, 31],
+        "min_child_samples": [3, 5, 10, 20],
+        "subsample": [0.6, 0.8, 1.0],
+        "subsample_freq": [1],
+    },
+    "CatBoost": {
+        "learning_rate": [0.01, 0.03, 0.1, 0.3],
+        "depth": [2, 4, 6, 8],
+        "l2_leaf_reg": [1, 3, 5, 10],
+    },
+}
+
+
+def rolling_origin_splits(periods, min_train_months=36, horizon_months=12, step_months=12):
+    # (train, test) row positions: train on every month before the origin, test on the next horizon_months,
+    # then move the origin forward by step_months
+    periods = pd.Series(pd.to_datetime(pd.Series(periods).to_numpy()))
+    months = np.sort(periods.unique())
+    splits = []
+    for origin in range(min_train_months, len(months) - horizon_months + 1, step_months):
+        train = np.flatnonzero(periods < months[origin])
+        test = np.flatnonzero(periods.isin(months[origin:origin + horizon_months]))
+        splits.append((train, test))
+    return splits
+
+
+def make_model(name, models=MODELS):
+    preprocessing, estimator, _ = models[name]
+    return make_pipeline(*PREPROCESSING[preprocessing](), clone(estimator))
+
+
+def backtest(model, X, y, splits):
+    # scores on the held-out months of every fold only
+    rows = []
+    for fold, (train, test) in enumerate(splits):
+        model = clone(model)
+        model.fit(X.iloc[train], y.iloc[train])
+        predictions = model.predict(X.iloc[test])
+        rows.append({
+            "fold": fold,
+            "train_rows": len(train),
+            "test_rows": len(test),
+            "mse": mean_squared_error(y.iloc[test], predictions),
+            "r2": r2_score(y.iloc[test], predictions),
+        })
+    return pd.DataFrame(rows)
+
+
+def backtest_models(X, y, splits, models=MODELS):
+    # mean held-out scores per model
+    rows = []
+    for name in models:
+        df_folds = backtest(make_model(name, models), X, y, splits)
+        rows.append({"model": name, "mse": df_folds["mse"].mean(), "r2": df_folds["r2"].mean()})
+    return pd.DataFrame(rows).set_index("model")
+
+
+def search(name, X, y, splits, n_candidates=81, min_resources=25, max_resources=800, factor=3, n_threads=None, random_state=0):
+    # budgeted random search with successive halving: every round keeps the best 1/factor of the candidates
+    # and gives them factor times more trees, so weak configurations are pruned after a few cheap fits
+    model = make_model(name)
+    step = model.steps[-1][0]
+    _, _, thread_param = MODELS[name]
+    if thread_param:
+        model.set_params(**{f"{step}__{thread_param}": 1})
+    # catboost only lists parameters that were set explicitly
+    model.set_params(**{f"{step}__n_estimators": max_resources})
+
+    n_workers, _ = thread_budget(n_candidates, n_threads)
+    searcher = HalvingRandomSearchCV(
+        model,
+        {f"{step}__{k}": v for k, v in SEARCH_SPACES[name].items()},
+        n_candidates=n_candidates,
+        resource=f"{step}__n_estimators",
+        min_resources=min_resources,
+        max_resources=max_resources,
+        factor=factor,
+        cv=splits,
+        scoring="neg_mean_squared_error",
+        n_jobs=n_workers,
+        random_state=random_state,
+    )
+    return searcher.fit(X, y)
@@ -0,0 +1,153 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+from synthetic_db import SCALES, generate
+
+
+# every stage runs in a fresh process, so peak RSS is the stage's own and not the whole run's
+BENCH_PATH = "output/path/benchmarks"
+HISTORY_FILE = "history.jsonl"
+# a stage is reported as a regression if it got this much slower / bigger than in the previous run of the same scale
+REGRESSION_RATIO = 1.2
+
+
+def _measured(func, *args):
+    wall, cpu = time.perf_counter(), time.process_time()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    func(*args)
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # worker processes (loky, process pools) are added to the stage's cpu time and peak
+    return {
+        "wall_s": time.perf_counter() - wall,
+        "cpu_s": time.process_time() - cpu + (children_after.ru_utime - children.ru_utime) + (children_after.ru_stime - children.ru_stime),
+        "peak_rss_mb": max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, children_after.ru_maxrss) / 1024,
+    }
+
+
+def measure(func, *args):
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+        return executor.submit(_measured, func, *args).result()
+
+
+def synthetic_features(accidents_path, features_path, seed=0):
+    # monthly pedestrian counts with random weather / traffic columns, same shape as the features stage output
+    from train_traffic_weather_models import VARIABLES
+    df_acc = pd.read_csv(accidents_path)
+    df_acc["period"] = pd.to_datetime(df_acc["date"]).dt.to_period("M").dt.to_timestamp()
+    df_acc = df_acc.groupby("period").agg(count=("count", "sum")).reset_index()
+    df_acc["period"] = df_acc["period"].dt.date
+    rng = np.random.default_rng(seed)
+    for name in VARIABLES:
+        df_acc[name] = rng.normal(0, 1, len(df_acc))
+    df_acc["year"] = pd.to_datetime(df_acc["period"]).dt.year
+    df_acc.to_pickle(features_path)
+
+
+def train_models(features_path, cache_dir):
+    # train stage with an empty model cache, so the fits are timed and not the cache reads
+    from model_zoo import evaluate_models
+    from train_traffic_weather_models import training_data
+    _, X, y, X_all, y_all = training_data(pd.read_pickle(features_path))
+    evaluate_models(X, y, X_all, y_all, cache_dir=cache_dir)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_history(history_path):
+    if not os.path.exists(history_path):
+        return []
+    with open(history_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run_benchmark(scale="100k", seed=0, bench_path=BENCH_PATH, models=True):
+    from calculate_accidents_stats import stages
+    from train_traffic_weather_models import backtest
+
+    n_incidents = SCALES.get(scale) or int(scale)
+    run_path = os.path.join(bench_path, f"{scale}-{seed}")
+    db_path = os.path.join(run_path, "accidents.db")
+    store_path = os.path.join(run_path, "columnar")
+    output_path = os.path.join(run_path, "output")
+    results = {}
+
+    # databases are kept between runs, the generator is deterministic for a scale and seed
+    os.makedirs(run_path, exist_ok=True)
+    if not os.path.exists(db_path):
+        results["generate"] = measure(generate, db_path, n_incidents, seed)
+
+    for name, (func, inputs, outputs) in stages(db_path, output_path, store_path).items():
+        for path in outputs.values():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        results[name] = measure(func, inputs, outputs)
+
+    if models:
+        features_path = os.path.join(output_path, ".pipeline", "features.pkl")
+        synthetic_features(os.path.join(output_path, "pedestrians-accidents-by-days.csv"), features_path, seed)
+        cache_dir = os.path.join(run_path, "model-cache")
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        results["train"] = measure(train_models, features_path, cache_dir)
+        results["backtest"] = measure(backtest, {"features": features_path}, {"backtest": os.path.join(output_path, "model-backtest.csv")})
+
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "scale": scale,
+        "incidents": n_incidents,
+        "seed": seed,
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "stages": results,
+    }
+
+
+def regressions(record, previous, ratio=REGRESSION_RATIO):
+    # [(stage, metric, previous value, current value)] for metrics that grew by more than ratio
+    found = []
+    for name, metrics in record["stages"].items():
+        before = previous["stages"].get(name)
+        if not before:
+            continue
+        for metric in ("wall_s", "peak_rss_mb"):
+            if before[metric] > 0 and metrics[metric] / before[metric] > ratio:
+                found.append((name, metric, before[metric], metrics[metric]))
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="times and memory-profiles the pipeline stages on a synthetic database")
+    parser.add_argument("--scale", default="100k", help=f"{', '.join(SCALES)} or a number of incidents")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--bench-path", default=BENCH_PATH)
+    parser.add_argument("--no-models", action="store_true", help="skip the model training stages")
+    args = parser.parse_args()
+
+    history_path = os.path.join(args.bench_path, HISTORY_FILE)
+    previous = [x for x in read_history(history_path) if x["scale"] == args.scale and x["seed"] == args.seed]
+    record = run_benchmark(args.scale, args.seed, args.bench_path, not args.no_models)
+    with open(history_path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+    for name, metrics in record["stages"].items():
+        print(f"{name:>14}  {metrics['wall_s']:9.2f} s wall  {metrics['cpu_s']:9.2f} s cpu  {metrics['peak_rss_mb']:9.0f} MB peak")
+    if previous:
+        for name, metric, before, after in regressions(record, previous[-1]):
+            print(f"regression: {name} {metric} {before:.2f} -> {after:.2f}")
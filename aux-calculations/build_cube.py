@@ -0,0 +1,155 @@
+import gzip
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# flag bits of the cube: name -> boolean columns that all have to be True
+FLAGS = {
+    "bicycle": ["involved_bicycle"],
+    "pedestrian": ["pedestrian_crossing", "involved_pedestrian"],
+    "alcohol": ["intoxicated_alcohol"],
+    "injury": ["injury_any"],
+}
+
+# series shown on the site (keys are the chart ids) -> flags that have to be set
+SERIES = {
+    "total-accidents": [],
+    "bicycle-accidents": ["bicycle"],
+    "pedestrians-accidents": ["pedestrian"],
+    "alcohol-accidents": ["alcohol"],
+}
+
+UNKNOWN = "brak danych"
+
+
+def _codes(column):
+    # category codes with missing values mapped to an extra UNKNOWN category
+    categorical = pd.Categorical(column)
+    categories = [str(x) for x in categorical.categories]
+    codes = categorical.codes.astype(np.int64)
+    if (codes < 0).any():
+        codes[codes < 0] = len(categories)
+        categories.append(UNKNOWN)
+    return codes, categories
+
+
+def flag_codes(df):
+    # bit code of FLAGS per incident
+    flags = np.zeros(len(df), dtype=np.int64)
+    for bit, columns in enumerate(FLAGS.values()):
+        mask = np.ones(len(df), dtype=bool)
+        for column in columns:
+            mask &= df[column].to_numpy(dtype=bool)
+        flags |= mask.astype(np.int64) << bit
+    return flags
+
+
+def build_cube(df, date_column="date_formatted"):
+    # one pass over the incidents: every incident becomes a linear cell index of
+    # day x voivodeship x type x flags, np.unique then counts the non-empty cells
+    days = df[date_column].to_numpy(dtype="datetime64[D]")
+    first_day = days.min()
+    day = (days - first_day).astype(np.int64)
+    voivodeship, voivodeships = _codes(df["voivodeship"])
+    accident_type, types = _codes(df["type"])
+    flags = flag_codes(df)
+
+    n_voivodeships, n_types, n_flags = len(voivodeships), len(types), 1 << len(FLAGS)
+    cells, counts = np.unique(((day * n_voivodeships + voivodeship) * n_types + accident_type) * n_flags + flags, return_counts=True)
+
+    cells, flags = np.divmod(cells, n_flags)
+    cells, accident_type = np.divmod(cells, n_types)
+    day, voivodeship = np.divmod(cells, n_voivodeships)
+    return {
+        "first_day": str(first_day),
+        "voivodeships": voivodeships,
+        "types": types,
+        "flags": list(FLAGS),
+        "day": day.astype(np.int32),
+        "voivodeship": voivodeship.astype(np.int16),
+        "type": accident_type.astype(np.int16),
+        "flag": flags.astype(np.uint8),
+        "count": counts.astype(np.int32),
+    }
+
+
+def cube_frame(cube):
+    df = pd.DataFrame({k: cube[k] for k in ("day", "voivodeship", "type", "flag", "count")})
+    dates = np.datetime64(cube["first_day"], "D") + df["day"].to_numpy()
+    df["month"] = dates.astype("datetime64[M]").astype(np.int64)  # months since 1970-01
+    df["year"] = dates.astype("datetime64[Y]").astype(np.int64) + 1970
+    return df
+
+
+def flag_mask(flag_names):
+    return sum(1 << list(FLAGS).index(x) for x in flag_names)
+
+
+def rolling_avg(counts, window=12):
+    # same as the charts: mean of the 12 months up to the current one, null for the first 12
+    sums = np.convolve(counts, np.ones(window), mode="full")[:len(counts)] / window
+    return [None if i < window else round(float(x), 2) for i, x in enumerate(sums)]
+
+
+def series_slice(df_cube, period, periods, by=None, labels=None):
+    # {series: counts per period} or {series: {label: counts per period}}
+    result = {}
+    for name, flag_names in SERIES.items():
+        mask = flag_mask(flag_names)
+        df_x = df_cube[(df_cube["flag"].to_numpy() & mask) == mask]
+        if by is None:
+            counts = df_x.groupby(period)["count"].sum().reindex(periods, fill_value=0)
+            result[name] = counts.astype(int).tolist()
+        else:
+            counts = df_x.groupby([by, period])["count"].sum().unstack(fill_value=0).reindex(columns=periods, fill_value=0)
+            result[name] = {labels[code]: row.astype(int).tolist() for code, row in counts.iterrows()}
+    return result
+
+
+def monthly_slice(cube):
+    df_cube = cube_frame(cube)
+    periods = list(range(int(df_cube["month"].min()), int(df_cube["month"].max()) + 1))
+    counts = series_slice(df_cube, "month", periods)
+    return {
+        "periods": [str(np.datetime64(x, "M")) for x in periods],
+        "series": {name: {"count": x, "rolling_avg": rolling_avg(np.array(x))} for name, x in counts.items()},
+        "by_voivodeship": series_slice(df_cube, "month", periods, "voivodeship", cube["voivodeships"]),
+    }
+
+
+def yearly_slice(cube):
+    df_cube = cube_frame(cube)
+    years = list(range(int(df_cube["year"].min()), int(df_cube["year"].max()) + 1))
+    return {
+        "years": years,
+        "series": series_slice(df_cube, "year", years),
+        "by_voivodeship": series_slice(df_cube, "year", years, "voivodeship", cube["voivodeships"]),
+        "by_type": series_slice(df_cube, "year", years, "type", cube["types"]),
+    }
+
+
+def write_json_gz(data, path):
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+
+def export_cube(cube, output_path):
+    # full cube for new breakdowns without another DB pass + pre-rolled slices for the site
+    np.savez_compressed(
+        os.path.join(output_path, "accidents-cube.npz"),
+        **{k: np.asarray(v) for k, v in cube.items()},
+    )
+    write_json_gz(monthly_slice(cube), os.path.join(output_path, "accidents-by-months.json.gz"))
+    write_json_gz(yearly_slice(cube), os.path.join(output_path, "accidents-by-years.json.gz"))
+
+
+def load_cube(path):
+    with np.load(path) as data:
+        cube = {k: data[k] for k in data.files}
+    cube["first_day"] = str(cube["first_day"])
+    for k in ("voivodeships", "types", "flags"):
+        cube[k] = cube[k].tolist()
+    return cube
@@ -1,4 +1,4 @@
-import sqlite3
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
@@ -7,252 +7,249 @@ from folium.plugins import HeatMap
 import json
 
 import datetime
-
-
-# get all accidents, no vehicle details, no passenger details
-conn = sqlite3.connect("database/path/accidents.db")
-sqlstr = f"""
-    SELECT zzz_incidents.incident_id, aaa_types.type,
-    aaa_voivodeships.voivodeship, aaa_districts.region, aaa_communes.commune, lat, lng,
-    unix_timestamp, date, time, period, year, month,
-    light, weather,
-    aaa_places.place, aaa_places_surface_conds.place_surface_cond
-    FROM zzz_incidents
-    INNER JOIN aaa_types ON type_id = aaa_types.nid
-
-    INNER JOIN aaa_voivodeships ON voivodeship_id = aaa_voivodeships.nid
-    INNER JOIN aaa_districts ON district_id = aaa_districts.nids
-    INNER JOIN aaa_communes ON commune_id = aaa_communes.nid
-
-    INNER JOIN aaa_cond_light ON cond_light_id = aaa_cond_light.nid
-    INNER JOIN aaa_cond_weather ON cond_weather_id = aaa_cond_weather.nid
-
-    INNER JOIN aaa_place_markings ON place_markings_id = aaa_place_markings.nid
-    INNER JOIN aaa_place_terrains ON place_terrain_type_id = aaa_place_terrains.nid
-    INNER JOIN aaa_places ON place_id = aaa_places.nid
-    INNER JOIN aaa_places_cross_types ON place_cross_type_id = aaa_places_cross_types.nid
-    INNER JOIN aaa_places_geometries ON place_geometry_id = aaa_places_geometries.nid
-    INNER JOIN aaa_places_road_types ON place_road_type_id = aaa_places_road_types.nid
-    INNER JOIN aaa_places_roadlights ON place_roadlights_id = aaa_places_roadlights.nid
-    INNER JOIN aaa_places_speed_limits ON place_speed_limit_id = aaa_places_speed_limits.nid
-    INNER JOIN aaa_places_surface_conds ON place_surface_cond_id = aaa_places_surface_conds.nid
-    INNER JOIN aaa_places_surface_types ON place_surface_type_id = aaa_places_surface_types.nid
-
-    WHERE type_id IS NOT NULL;
-"""
-c = conn.cursor()
-c.execute(sqlstr)
-accidents = c.fetchall()
-conn.close()
-
-headers = [
-    "incident_id", "type",
-    "voivodeship", "region", "commune", "lat", "lng",
-    "unix_timestamp", "date", "time", "period", "year", "month",
-    "light", "weather",
-    "place", "place_surface_condition"
-]
-accidents = [{k:v for k, v in zip(headers, x)} for x in accidents]
-df = pd.DataFrame.from_records(accidents)
-df['date_formatted'] = pd.to_datetime(df['date'])
-
-
-# get all participants
-conn = sqlite3.connect("database/path/accidents.db")
-sqlstr = f"""
-    SELECT zzz_participants.nid, zzz_participants.incident_id, bbb_vehicle_types.vehicle_type, bbb_vehicle_details.vehicle_detail
-    FROM zzz_participants
-    LEFT JOIN bbb_vehicle_types ON zzz_participants.vehicle_type_id = bbb_vehicle_types.nid
-    LEFT JOIN bbb_vehicle_details ON zzz_participants.vehicle_detail_id = bbb_vehicle_details.nid
-    LEFT JOIN bbb_vehicle_models ON zzz_participants.vehicle_model_id = bbb_vehicle_models.nid
-"""
-c = conn.cursor()
-c.execute(sqlstr)
-participants = c.fetchall()
-conn.close()
-
-
-headers = [
-    "vehicle_id", "incident_id", "vehicle_type", "vehicle_detail"
-]
-participants = [{k:v for k, v in zip(headers, x)} for x in participants]
-df_participants = pd.DataFrame.from_records(participants)
-
-
-# get all passengers
-conn = sqlite3.connect("database/path/accidents.db")
-sqlstr = f"""
-    SELECT zzz_passengers.incident_id, zzz_passengers.vehicle_id,
-    ccc_passenger_types.passenger_type, zzz_passengers.born, zzz_passengers.born_year, zzz_passengers.gender,
-    ccc_rights.rights, zzz_passengers.driving_experience, ccc_under_influences.under_influence,
-    ccc_injuries.injury, ccc_penalties.penalty, ccc_faults.fault
-    FROM zzz_passengers
-    LEFT JOIN ccc_passenger_types ON zzz_passengers.passenger_type_id = ccc_passenger_types.nid
-    LEFT JOIN ccc_rights ON zzz_passengers.rights_id = ccc_rights.nid
-    LEFT JOIN ccc_under_influences ON zzz_passengers.under_influence_id = ccc_under_influences.nid
-    LEFT JOIN ccc_injuries ON zzz_passengers.injury_id = ccc_injuries.nid
-    LEFT JOIN ccc_penalties ON zzz_passengers.penalty_id = ccc_penalties.nid
-    LEFT JOIN ccc_faults ON zzz_passengers.fault_id = ccc_faults.nid
-"""
-c = conn.cursor()
-c.execute(sqlstr)
-passengers = c.fetchall()
-conn.close()
-
-
-headers = [
-    "incident_id", "vehicle_id",
-    "passenger_type", "born", "born_year", "gender",
-    "rights", "driving_experience", "under_influence", "injury", "penalty", "fault",
-]
-passengers = [{k:v for k, v in zip(headers, x)} for x in passengers]
-df_passengers = pd.DataFrame.from_records(passengers)
-
-
-
-df['involved_bicycle'] = df['incident_id'].isin(df_participants[df_participants.vehicle_type == "Rower"]['incident_id'])
-df['pedestrian_born_year'] = df['incident_id'].map(pedestrians_age_dict)
-df['pedestrian_age'] = df["year"] - df['pedestrian_born_year']
-df['involved_pedestrian'] = df['incident_id'].isin(df_participants[df_participants.vehicle_type == "Pieszy"]['incident_id'])
-df['involved_pedestrian_below18'] = df.apply(lambda x: x["involved_pedestrian"] and x["pedestrian_age"] and x["pedestrian_age"] < 18, axis=1)
-
-df['injury_minor'] = df['incident_id'].isin(df_passengers[df_passengers.injury == "Ranny lekko"]['incident_id'])
-df['injury_major'] = df['incident_id'].isin(df_passengers[df_passengers.injury == "Ranny ciężko"]['incident_id'])
-df['injury_death_30days'] = df['incident_id'].isin(df_passengers[df_passengers.injury == "Śmierć w ciągu 30 dni"]['incident_id'])
-df['injury_death_instant'] = df['incident_id'].isin(df_passengers[df_passengers.injury == "Smierć na miejscu"]['incident_id'])
-
-df['intoxicated_alcohol'] = df['incident_id'].isin(df_passengers[(df_passengers.under_influence == "Alkoholu") & (df_passengers.passenger_type == "Kierujący")]['incident_id'])
-df['intoxicated_drugs'] = df['incident_id'].isin(df_passengers[(df_passengers.under_influence == "Innego środka") & (df_passengers.passenger_type == "Kierujący")]['incident_id'])
-
-
-### General numbers
-df_counts = df.groupby(["year", "date_formatted"]).count().reset_index()[["year", "date_formatted", "incident_id"]]
-df_counts.rename(columns={"date_formatted": "date", "incident_id": "count"}, inplace=True)
-df_counts.to_csv("output/path/total-accidents-by-days.csv", index=False)
-
-### Bicycles
-df_counts = df[df['involved_bicycle']==True].groupby(["year", "date_formatted"]).count().reset_index()[["year", "date_formatted", "incident_id"]]
-df_counts.rename(columns={"date_formatted": "date", "incident_id": "count"}, inplace=True)
-df_counts.to_csv('output/path/bicycle-accidents-by-days.csv', index=False)
-
-avg_count_bikes_before = len(df[(df['involved_bicycle']==True) & (df['date']>="2010-05-21") & (df['date']<"2011-05-21")])/12
-avg_count_bikes_in_year_of_intro = len(df[(df['involved_bicycle']==True) & (df['date']>="2011-05-21") & (df['date']<"2012-05-21")])/12
-avg_count_bikes_in_following_years = len(df[(df['involved_bicycle']==True) & (df['date']>="2012-05-21") & (df['date']<"2022-05-21")])/120
-
-avg_count_bikes_injury_before = len(df[(
-    (df['injury_minor']==True) | (df['injury_major']==True) | (df['injury_death_30days']==True) | (df['injury_death_instant']==True)
-) & (df['involved_bicycle']==True) & (df['date']>="2010-05-21") & (df['date']<"2011-05-21")])/12
-avg_count_bikes_injury_in_year_of_intro = len(df[(
-    (df['injury_minor']==True) | (df['injury_major']==True) | (df['injury_death_30days']==True) | (df['injury_death_instant']==True)
-) & (df['involved_bicycle']==True) & (df['date']>="2011-05-21") & (df['date']<"2012-05-21")])/12
-avg_count_bikes_injury_in_following_years = len(df[(
-    (df['injury_minor']==True) | (df['injury_major']==True) | (df['injury_death_30days']==True) | (df['injury_death_instant']==True)
-) & (df['involved_bicycle']==True) & (df['date']>="2012-05-21") & (df['date']<"2022-05-21")])/120
-
-avg_count_all_before = len(df[(df['date']>="2010-05-21") & (df['date']<"2011-05-21")])/12
-avg_count_all_in_year_of_intro = len(df[(df['date']>="2011-05-21") & (df['date']<"2012-05-21")])/12
-avg_count_all_in_following_years = len(df[(df['date']>="2012-05-21") & (df['date']<"2022-05-21")])/120
-
-# Number of accidents with bikes involved
-print(round(avg_count_bikes_before, 0))
-print(round(avg_count_bikes_in_year_of_intro, 0))
-print(round(avg_count_bikes_in_following_years, 0))
-# Number of accidents with bikes involved where people injured
-print(round(avg_count_bikes_injury_before, 0))
-print(round(avg_count_bikes_injury_in_year_of_intro, 0))
-print(round(avg_count_bikes_injury_in_following_years, 0))
-# share of accidents with bikes involved in total accidents
-print(  round((avg_count_bikes_before / avg_count_all_before) * 100, 1)  )
-print(  round((avg_count_bikes_in_year_of_intro / avg_count_all_in_year_of_intro) * 100, 1)  )
-print(  round((avg_count_bikes_in_following_years / avg_count_all_in_following_years) * 100, 1)  )
-
-### Pedestrians
-df_counts = df[(df["place"]=="Przejście dla pieszych") & (df['involved_pedestrian']==True)].groupby(["year", "date_formatted"]).count().reset_index()[["year", "date_formatted", "incident_id"]]
-df_counts.rename(columns={"date_formatted": "date", "incident_id": "count"}, inplace=True)
-df_counts.to_csv('output/path/pedestrians-accidents-by-days.csv', index=False)
-
-avg_count_pedestrian_previous_years = len(df[(df["place"]=="Przejście dla pieszych") & (df['involved_pedestrian']==True) & (df['date']>="2010-06-01") & (df['date']<"2020-05-31")])/120
-avg_count_pedestrian_before = len(df[(df["place"]=="Przejście dla pieszych") & (df['involved_pedestrian']==True) & (df['date']>="2020-06-01") & (df['date']<"2021-05-31")])/12
-avg_count_pedestrian_in_year_of_intro = len(df[(df["place"]=="Przejście dla pieszych") & (df['involved_pedestrian']==True) & (df['date']>="2021-06-01") & (df['date']<"2022-05-31")])/12
-
-avg_count_pedestrian_injury_previous_years = len(df[(df["place"]=="Przejście dla pieszych") & (
-    (df['injury_minor']==True) | (df['injury_major']==True) | (df['injury_death_30days']==True) | (df['injury_death_instant']==True)
-) & (df['involved_pedestrian']==True) & (df['date']>="2010-06-01") & (df['date']<"2020-05-31")])/120
-avg_count_pedestrian_injury_before = len(df[(df["place"]=="Przejście dla pieszych") & (
-    (df['injury_minor']==True) | (df['injury_major']==True) | (df['injury_death_30days']==True) | (df['injury_death_instant']==True)
-) & (df['involved_pedestrian']==True) & (df['date']>="2020-06-01") & (df['date']<"2021-05-31")])/12
-avg_count_pedestrian_injury_in_year_of_intro = len(df[(df["place"]=="Przejście dla pieszych") & (
-    (df['injury_minor']==True) | (df['injury_major']==True) | (df['injury_death_30days']==True) | (df['injury_death_instant']==True)
-) & (df['involved_pedestrian']==True) & (df['date']>="2021-06-01") & (df['date']<"2022-05-31")])/12
-
-avg_count_all_previous_years = len(df[(df['date']>="2010-06-01") & (df['date']<"2020-05-31")])/120
-avg_count_all_before = len(df[(df['date']>="2020-06-01") & (df['date']<"2021-05-31")])/12
-avg_count_all_in_year_of_intro = len(df[(df['date']>="2021-06-01") & (df['date']<"2022-05-31")])/12
-
-
-# Number of accidents on pedestrian crossing with pedestrians involved
-print(round(avg_count_pedestrian_previous_years, 0))
-print(round(avg_count_pedestrian_before, 0))
-print(round(avg_count_pedestrian_in_year_of_intro, 0))
-print()
-# Number of accidents on pedestrian crossing with pedestrians involved where people injured
-print(round(avg_count_pedestrian_injury_previous_years, 0))
-print(round(avg_count_pedestrian_injury_before, 0))
-print(round(avg_count_pedestrian_injury_in_year_of_intro, 0))
-print()
-# share of accidents on pedestrian crossing with pedestrians involved in total accidents
-print(  round((avg_count_pedestrian_previous_years / avg_count_all_previous_years) * 100, 1)  )
-print(  round((avg_count_pedestrian_before / avg_count_all_before) * 100, 1)  )
-print(  round((avg_count_pedestrian_in_year_of_intro / avg_count_all_in_year_of_intro) * 100, 1)  )
-
-
-### Types of accidents
-df_types = df.groupby(["type"]).count().reset_index()[["type", "incident_id"]].sort_values(by="incident_id", ascending=False)
-df_types.rename(columns={"type": "type", "incident_id": "count"}, inplace=True)
-df_types.to_csv('output/path/accidents-by-types.csv', index=False)
-
-
-
-### Police getting tickets
-# get all accidents, no vehicle details, no passenger details
-conn = sqlite3.connect("database/path/accidents.db")
-sqlstr = f"""
-    SELECT zzz_participants.incident_id,
-    aaa_types.type,
-    bbb_vehicle_types.vehicle_type, bbb_vehicle_details.vehicle_detail,
-    ccc_passenger_types.passenger_type, ccc_under_influences.under_influence, ccc_penalties.penalty, ccc_faults.fault
-    FROM zzz_participants
-    INNER JOIN zzz_passengers ON zzz_participants.nid = zzz_passengers.vehicle_id
-    LEFT JOIN bbb_vehicle_types ON zzz_participants.vehicle_type_id = bbb_vehicle_types.nid
-    LEFT JOIN bbb_vehicle_details ON zzz_participants.vehicle_detail_id = bbb_vehicle_details.nid
-    LEFT JOIN ccc_passenger_types ON zzz_passengers.passenger_type_id = ccc_passenger_types.nid
-    LEFT JOIN ccc_under_influences ON zzz_passengers.under_influence_id = ccc_under_influences.nid
-    LEFT JOIN ccc_penalties ON zzz_passengers.penalty_id = ccc_penalties.nid
-    LEFT JOIN ccc_faults ON zzz_passengers.fault_id = ccc_faults.nid
-    INNER JOIN zzz_incidents ON zzz_participants.incident_id = zzz_incidents.incident_id
-    LEFT JOIN aaa_types ON zzz_incidents.type_id = aaa_types.nid
-    WHERE zzz_incidents.type_id IS NOT NULL;
-"""
-c = conn.cursor()
-c.execute(sqlstr)
-accidents = c.fetchall()
-conn.close()
-
-
-headers = [
-    "incident_id",
-    "type",
-    "vehicle_type", "vehicle_detail",
-    "passenger_type", "under_influence", "penalty", "fault",
-]
-accidents = [{k:v for k, v in zip(headers, x)} for x in accidents]
-df = pd.DataFrame.from_records(accidents)
-
-
-df["is_police"] = df["vehicle_detail"].apply(lambda x: True if x=='Pojazd uprzywilejowany Policja' else False)
-df["is_fault"] = df['fault'].apply(lambda x: True if x else False)
-df["did_anybody_got_penalty"] = df['incident_id'].isin(df[df["penalty"].notna()]["incident_id"])
-df["penalty_x"] = df["penalty"].apply(lambda x: x if x else "Brak")
-df["fault_x"] = df["fault"].apply(lambda x: x if x else "Brak")
-
-df[(df["did_anybody_got_penalty"]==True)].groupby(["passenger_type", "fault_x", "penalty_x", "is_police"]).count().reset_index()[["passenger_type", "fault_x", "penalty_x", "is_police", "incident_id"]].to_excel("output/path/policja.xlsx")
+import os
+
+from query_loader import read_query
+from db_setup import connect, check_query_plans
+from queries import (
+    DB_PATH, INCIDENTS_SQL, INCIDENTS_DTYPES, FLAGS_SQL, FLAGS_DTYPES,
+    PARTICIPANTS_SQL, PARTICIPANTS_DTYPES, PASSENGERS_SQL, PASSENGERS_DTYPES,
+)
+from law_changes import LAW_CHANGES, law_change_counts
+from law_change_stats import law_change_stats
+from build_cube import build_cube, export_cube
+from daily_series import export_daily_series, MANIFEST_FILE, BINARY_FILE
+from heatmap_tiles import export_tiles, cell_centers
+from pipeline import cli
+from instrumentation import span, rows
+from lazy_query import scan, where, derive, semi_join, group_by, collect, to_sql
+from adjacency import incident_adjacency, any_over_children, max_over_children, to_children
+
+
+# read incidents from the columnar store written by export_columnar_store.py
+# instead of re-running the 16-way lookup JOIN on every run
+USE_COLUMNAR_STORE = True
+
+# derive per-incident flags inside SQLite (one GROUP BY per child table, one compact row per incident)
+# instead of pulling every participant and passenger into pandas and scanning them with isin
+FLAGS_IN_SQL = True
+
+# daily series written by the aggregate stage: series (chart id) -> flag column (None - all incidents)
+DAILY_SERIES = {
+    "total-accidents": None,
+    "bicycle-accidents": "involved_bicycle",
+    "alcohol-accidents": "intoxicated_alcohol",
+    "pedestrians-accidents": "pedestrians_on_crossing",
+}
+
+
+def connect_checked(db_path):
+    # fail early if the indexes from db_setup.py are missing and a query would scan a whole child table
+    conn = connect(db_path)
+    check_query_plans(conn)
+    return conn
+
+
+def export_columnar(inputs, outputs):
+    # the store is a copy of the db, so it is re-exported whenever the db changes
+    from export_columnar_store import export_store
+    export_store(inputs["db"], outputs["store"])
+
+
+def load(inputs, outputs):
+    headers = list(INCIDENTS_DTYPES)
+
+    if USE_COLUMNAR_STORE:
+        from export_columnar_store import load_incidents
+        df = load_incidents(columns=headers, store_path=inputs["store"])
+
+    else:
+        conn = connect_checked(inputs["db"])
+        df = read_query(conn, INCIDENTS_SQL, INCIDENTS_DTYPES)
+        conn.close()
+
+    df['date_formatted'] = pd.to_datetime(df['date'])
+    rows(rows_out=len(df))
+    df.to_pickle(outputs["incidents"])
+
+
+def derive_flags(inputs, outputs):
+    df = pd.read_pickle(inputs["incidents"])
+    rows(rows_in=len(df))
+
+    if FLAGS_IN_SQL:
+        with span("flags query"):
+            conn = connect_checked(inputs["db"])
+            df_flags = read_query(conn, FLAGS_SQL, FLAGS_DTYPES)
+            conn.close()
+            rows(rows_out=len(df_flags))
+
+        df = df.merge(df_flags, on="incident_id", how="left")
+
+    else:
+        # get all participants and passengers
+        with span("participants and passengers query"):
+            conn = connect_checked(inputs["db"])
+            df_participants = read_query(conn, PARTICIPANTS_SQL, PARTICIPANTS_DTYPES)
+            df_passengers = read_query(conn, PASSENGERS_SQL, PASSENGERS_DTYPES)
+            conn.close()
+            rows(rows_out=len(df_participants) + len(df_passengers))
+
+        # incident -> vehicles -> passengers offsets, every flag is one reduction over them
+        adjacency = incident_adjacency(df["incident_id"].to_numpy(), df_participants, df_passengers)
+        incident_vehicles, incident_passengers = adjacency["incident_vehicles"], adjacency["incident_passengers"]
+        is_pedestrian = (df_participants.vehicle_type == "Pieszy").to_numpy()
+        is_driver = (df_passengers.passenger_type == "Kierujący").to_numpy()
+
+        # youngest pedestrian of each incident
+        on_foot = to_children(adjacency["vehicle_passengers"], is_pedestrian)
+        born_year = df_passengers["born_year"].to_numpy(dtype="float64")
+
+        df['involved_bicycle'] = any_over_children(incident_vehicles, df_participants.vehicle_type == "Rower")
+        df['pedestrian_born_year'] = max_over_children(incident_passengers, np.where(on_foot, born_year, np.nan))
+        df['involved_pedestrian'] = any_over_children(incident_vehicles, is_pedestrian)
+
+        df['injury_minor'] = any_over_children(incident_passengers, df_passengers.injury == "Ranny lekko")
+        df['injury_major'] = any_over_children(incident_passengers, df_passengers.injury == "Ranny ciężko")
+        df['injury_death_30days'] = any_over_children(incident_passengers, df_passengers.injury == "Śmierć w ciągu 30 dni")
+        df['injury_death_instant'] = any_over_children(incident_passengers, df_passengers.injury == "Smierć na miejscu")
+
+        df['intoxicated_alcohol'] = any_over_children(incident_passengers, (df_passengers.under_influence == "Alkoholu").to_numpy() & is_driver)
+        df['intoxicated_drugs'] = any_over_children(incident_passengers, (df_passengers.under_influence == "Innego środka").to_numpy() & is_driver)
+
+    df['pedestrian_age'] = df["year"] - df['pedestrian_born_year']
+    df['involved_pedestrian_below18'] = involved_pedestrian_below18(df)
+
+    df['injury_any'] = df['injury_minor'] | df['injury_major'] | df['injury_death_30days'] | df['injury_death_instant']
+    df['injury_severe'] = df['injury_major'] | df['injury_death_30days'] | df['injury_death_instant']
+    df['pedestrian_crossing'] = df["place"] == "Przejście dla pieszych"
+
+    df['pedestrians_on_crossing'] = df['pedestrian_crossing'] & df['involved_pedestrian']
+    rows(rows_out=len(df))
+    df.to_pickle(outputs["incidents"])
+
+
+def aggregate(inputs, outputs):
+    df = pd.read_pickle(inputs["incidents"])
+    rows(rows_in=len(df))
+
+    ### General numbers, bicycles, alcohol, pedestrians on crossings - counts per day
+    # one bincount over day offsets per series, zero-filled, with the day-of-year aggregates of the charts
+    with span("daily series"):
+        manifest = export_daily_series(df, DAILY_SERIES, os.path.dirname(outputs["daily_series"]))
+        n_days = manifest["n_days"] * len(DAILY_SERIES)
+        rows(rows_in=len(df), rows_out=n_days)
+
+    ### Law changes - before / in year of intro / after
+    # every window x subgroup count in one grouped pass, windows and subgroups are defined in law_changes.py
+    # avg_count - monthly average, share - % of all accidents in the window
+    with span("law changes"):
+        df_law_changes = law_change_counts(df, LAW_CHANGES)
+        rows(rows_in=len(df), rows_out=len(df_law_changes))
+    df_law_changes.to_csv(outputs["law_changes"], index=False)
+    for name, df_x in df_law_changes.groupby("law_change", sort=False):
+        print(name)
+        print(df_x.pivot(index="window", columns="subgroup", values="avg_count").loc[df_x["window"].unique()].round(0))
+        print(df_x[df_x["subgroup"]!="all"].pivot(index="window", columns="subgroup", values="share").loc[df_x["window"].unique()].round(1))
+        print()
+
+    ### Types of accidents
+    df_types = df.groupby(["type"], observed=True).size().reset_index(name="count").sort_values(by="count", ascending=False)
+    df_types.to_csv(outputs["types"], index=False)
+    rows(rows_out=n_days + len(df_law_changes) + len(df_types))
+
+
+def law_change_significance(inputs, outputs):
+    ### Law changes - are the changes vs the year before larger than the day-to-day noise?
+    # ratio to the "before" window with block bootstrap CIs and permutation p-values, resampled from the daily series
+    df = pd.read_pickle(inputs["incidents"])
+    df_stats = law_change_stats(df, LAW_CHANGES)
+    rows(rows_in=len(df), rows_out=len(df_stats))
+    df_stats.to_csv(outputs["law_change_stats"], index=False)
+    for (name, metric), df_x in df_stats.groupby(["law_change", "metric"], sort=False):
+        print(name, metric, "vs before")
+        print(df_x.set_index(["window", "subgroup"])[["ratio", "ci_low", "ci_high", "p_value"]].round(3))
+        print()
+
+
+def export(inputs, outputs):
+    df = pd.read_pickle(inputs["incidents"])
+    rows(rows_in=len(df))
+
+    ### Count cube - day x voivodeship x type x flags, with pre-rolled monthly and yearly slices for the site
+    with span("cube"):
+        cube = build_cube(df)
+        export_cube(cube, os.path.dirname(outputs["cube"]))
+        rows(rows_in=len(df), rows_out=len(cube["count"]))
+
+    ### Heatmap - per-cell counts on a web mercator grid instead of one point per incident
+    with span("heatmap"):
+        export_tiles(df, os.path.dirname(outputs["tiles"]))
+        heatmap = folium.Map(location=[52.0, 19.2], zoom_start=6)
+        cells = cell_centers(df, zoom=7)
+        HeatMap(cells, max_zoom=11).add_to(heatmap)
+        heatmap.save(outputs["heatmap"])
+        rows(rows_in=len(df), rows_out=len(cells))
+
+
+def involved_pedestrian_below18(df):
+    # age 0 counts as unknown, same as the truthiness check of the old per-row lambda; NaN < 18 is False
+    return df["involved_pedestrian"] & (df["pedestrian_age"] != 0) & (df["pedestrian_age"] < 18)
+
+
+def police_query():
+    # passengers of incidents where anybody got a penalty, counted by passenger type, fault, penalty and police vehicle
+    penalised = where(scan("passengers"), "penalty", "is not null")
+    q = where(scan("passengers"), "type_id", "is not null")
+    q = semi_join(q, penalised, "incident_id")
+    q = where(q, "passenger_type", "is not null")
+    q = derive(q, "is_police", "vehicle_detail", "=", "Pojazd uprzywilejowany Policja")
+    q = derive(q, "fault_x", "fault", "fill", "Brak")
+    q = derive(q, "penalty_x", "penalty", "fill", "Brak")
+    return group_by(q, ["passenger_type", "fault_x", "penalty_x", "is_police"], incident_id=("count", "*"))
+
+
+def police(inputs, outputs):
+    ### Police getting tickets
+    # filters, joins and the GROUP BY run in SQLite, only the breakdown is loaded
+    conn = connect_checked(inputs["db"])
+    q = police_query()
+    check_query_plans(conn, {"police": to_sql(conn, q)})
+    df_police = collect(conn, q)
+    conn.close()
+    rows(rows_out=len(df_police))
+    df_police.to_excel(outputs["police"])
+
+
+def stages(db_path=DB_PATH, output_path="output/path", store_path=None):
+    from export_columnar_store import STORE_PATH
+    work_path = os.path.join(output_path, ".pipeline")
+    incidents = os.path.join(work_path, "incidents.pkl")
+    incidents_flags = os.path.join(work_path, "incidents-flags.pkl")
+    store = {"store": store_path or STORE_PATH}
+    source = store if USE_COLUMNAR_STORE else {"db": db_path}
+    return {
+        **({"export_store": (export_columnar, {"db": db_path}, store)} if USE_COLUMNAR_STORE else {}),
+        "load": (load, source, {"incidents": incidents}),
+        "derive_flags": (derive_flags, {"incidents": incidents, "db": db_path}, {"incidents": incidents_flags}),
+        "aggregate": (aggregate, {"incidents": incidents_flags}, {
+            **{x: os.path.join(output_path, f"{x}-by-days.csv") for x in DAILY_SERIES},
+            "daily_series": os.path.join(output_path, MANIFEST_FILE),
+            "daily_series_data": os.path.join(output_path, BINARY_FILE),
+            "law_changes": os.path.join(output_path, "law-changes.csv"),
+            "types": os.path.join(output_path, "accidents-by-types.csv"),
+        }),
+        "law_change_stats": (law_change_significance, {"incidents": incidents_flags}, {
+            "law_change_stats": os.path.join(output_path, "law-change-stats.csv"),
+        }),
+        "export": (export, {"incidents": incidents_flags}, {
+            "cube": os.path.join(output_path, "accidents-cube.npz"),
+            "tiles": os.path.join(output_path, "tiles", "index.json"),
+            "heatmap": os.path.join(output_path, "accidents-heatmap.html"),
+        }),
+        "police": (police, {"db": db_path}, {"police": os.path.join(output_path, "policja.xlsx")}),
+    }
+
+
+if __name__ == "__main__":
+    cli(stages(), "accidents stats")
@@ -0,0 +1,107 @@
+import json
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+
+# day-of-year charts: trailing mean over the last ROLLING_DAYS days within the same year, 29 February is left out
+ROLLING_DAYS = 7
+# binary next to the csv files: little-endian arrays described by the json manifest
+MANIFEST_FILE = "accidents-by-days.json"
+BINARY_FILE = "accidents-by-days.bin"
+
+
+def daily_counts(df, columns, date_column="date_formatted"):
+    # (first day, {series: counts per day}) - one bincount over day offsets per series, days without accidents are 0
+    days = df[date_column].to_numpy(dtype="datetime64[D]")
+    first_day = days.min()
+    offsets = (days - first_day).astype(np.int64)
+    n_days = int(offsets.max()) + 1
+    counts = {}
+    for name, column in columns.items():
+        selected = offsets if column is None else offsets[df[column].to_numpy(dtype=bool)]
+        counts[name] = np.bincount(selected, minlength=n_days).astype(np.uint32)
+    return first_day, counts
+
+
+def day_of_year_rolling(first_day, counts, window=ROLLING_DAYS):
+    # (years, array years x 366) - same values as the charts used to compute with d3.groups, NaN for missing days
+    dates = first_day + np.arange(len(counts))
+    month_day = dates - dates.astype("datetime64[M]")
+    months = dates.astype("datetime64[M]").astype(np.int64) % 12
+    keep = ~((months == 1) & (month_day == np.timedelta64(28, "D")))
+    dates, kept = dates[keep], counts[keep].astype(np.float64)
+
+    year_start = dates.astype("datetime64[Y]")
+    years = year_start.astype(np.int64) + 1970
+    doy = (dates - year_start.astype("datetime64[D]")).astype(np.int64)
+
+    # position of every kept day within its year, the window is cut at the start of the year
+    first_of_year = np.flatnonzero(np.r_[True, years[1:] != years[:-1]])
+    position = np.arange(len(dates)) - np.repeat(first_of_year, np.diff(np.r_[first_of_year, len(dates)]))
+    width = np.minimum(position + 1, window)
+    sums = np.r_[0, np.cumsum(kept)]
+    index = np.arange(len(dates))
+    rolling = (sums[index + 1] - sums[index + 1 - width]) / width
+
+    unique_years = np.unique(years)
+    result = np.full((len(unique_years), 366), np.nan, dtype=np.float32)
+    result[years - unique_years[0], doy] = rolling
+    return unique_years, result
+
+
+def write_csv(first_day, counts, path):
+    # same layout as before: year, date, count - now with a row for every day
+    dates = first_day + np.arange(len(counts))
+    pd.DataFrame({
+        "year": dates.astype("datetime64[Y]").astype(np.int64) + 1970,
+        "date": dates.astype(str),
+        "count": counts,
+    }).to_csv(path, index=False)
+
+
+def export_daily_series(df, columns, output_path, date_column="date_formatted"):
+    # {series}-by-days.csv per series + one binary with the counts and the day-of-year aggregates of every series
+    first_day, counts = daily_counts(df, columns, date_column)
+    return write_daily_series(first_day, counts, output_path)
+
+
+def write_daily_series(first_day, counts, output_path):
+    # counts: {series: counts per day from first_day}, all of the same length - also used by refresh_daily_series.py
+    arrays = {}
+    for name, x in counts.items():
+        years, rolling = day_of_year_rolling(first_day, x)
+        arrays[f"{name}/count"] = x
+        arrays[f"{name}/doy_rolling"] = rolling
+        # mean over the years for every day of the year, 29 February stays NaN
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            arrays[f"{name}/doy_mean"] = np.nanmean(rolling, axis=0).astype(np.float32)
+        write_csv(first_day, x, os.path.join(output_path, f"{name}-by-days.csv"))
+
+    manifest = {"first_day": str(first_day), "n_days": len(next(iter(counts.values()))), "years": years.tolist(), "rolling_days": ROLLING_DAYS, "arrays": {}}
+    offset = 0
+    with open(os.path.join(output_path, BINARY_FILE), "wb") as f:
+        for key, x in arrays.items():
+            # uint32 / float32 only, so every array stays 4-byte aligned for typed array views
+            data = x.astype(x.dtype.newbyteorder("<")).tobytes()
+            manifest["arrays"][key] = {"dtype": x.dtype.name, "shape": list(x.shape), "offset": offset}
+            f.write(data)
+            offset += len(data)
+    with open(os.path.join(output_path, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_daily_series(output_path):
+    # {array key: numpy array} from the binary written by export_daily_series
+    with open(os.path.join(output_path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    with open(os.path.join(output_path, BINARY_FILE), "rb") as f:
+        data = f.read()
+    return manifest, {
+        key: np.frombuffer(data, dtype=np.dtype(x["dtype"]).newbyteorder("<"), count=int(np.prod(x["shape"])), offset=x["offset"]).reshape(x["shape"])
+        for key, x in manifest["arrays"].items()
+    }
@@ -0,0 +1,88 @@
+import re
+import sqlite3
+import sys
+
+from queries import (
+    DB_PATH, INCIDENTS_SQL, FLAGS_SQL, MONTH_FINGERPRINTS_SQL, daily_counts_sql,
+)
+
+
+# covering indexes for the joins and GROUP BYs in queries.py
+INDEXES = [
+    # vehicle flags GROUP BY incident_id, participants query, police join
+    """CREATE INDEX IF NOT EXISTS idx_participants_incident
+    ON zzz_participants (incident_id, nid, vehicle_type_id, vehicle_detail_id, vehicle_model_id)""",
+    # passenger flags GROUP BY incident_id
+    """CREATE INDEX IF NOT EXISTS idx_passengers_incident
+    ON zzz_passengers (incident_id, vehicle_id, passenger_type_id, under_influence_id, injury_id, born_year)""",
+    # police join zzz_participants.nid = zzz_passengers.vehicle_id
+    """CREATE INDEX IF NOT EXISTS idx_passengers_vehicle
+    ON zzz_passengers (vehicle_id, passenger_type_id, under_influence_id, penalty_id, fault_id)""",
+    # police semi-join - incidents where anybody got a penalty
+    """CREATE INDEX IF NOT EXISTS idx_passengers_penalty
+    ON zzz_passengers (penalty_id, incident_id)""",
+    # WHERE type_id IS NOT NULL, month fingerprints and month filters of the incremental refresh
+    """CREATE INDEX IF NOT EXISTS idx_incidents_type_date
+    ON zzz_incidents (type_id, date, incident_id)""",
+]
+
+# read-oriented connection settings
+PRAGMAS = [
+    "PRAGMA mmap_size = 8589934592",  # 8 GiB
+    "PRAGMA cache_size = -1048576",  # 1 GiB, negative values are KiB
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA query_only = ON",
+]
+
+# queries whose plans are checked, PARTICIPANTS_SQL and PASSENGERS_SQL are left out - they read every row
+# of their child table, so a full scan is the expected plan
+CHECKED_QUERIES = {
+    "incidents": INCIDENTS_SQL,
+    "flags": FLAGS_SQL,
+    "month fingerprints": MONTH_FINGERPRINTS_SQL,
+    "daily counts": daily_counts_sql(),
+    "daily counts, refreshed months": daily_counts_sql("substr(zzz_incidents.date, 1, 7) IN ('2022-12')"),
+}
+CHILD_TABLES = ["zzz_participants", "zzz_passengers"]
+
+
+def setup_database(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    for sqlstr in INDEXES:
+        conn.execute(sqlstr)
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+
+def connect(db_path=DB_PATH):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    for sqlstr in PRAGMAS:
+        conn.execute(sqlstr)
+    return conn
+
+
+def full_scans(conn, sqlstr, params=()):
+    # plan steps scanning a child table without an index
+    pattern = re.compile(r"^SCAN (TABLE )?({})\b".format("|".join(CHILD_TABLES)))
+    plan = conn.execute("EXPLAIN QUERY PLAN " + sqlstr, params).fetchall()
+    return [detail for _, _, _, detail in plan if pattern.match(detail) and "INDEX" not in detail]
+
+
+def check_query_plans(conn, queries=CHECKED_QUERIES):
+    # queries: name -> sql, or (sql, params) for parameterised queries
+    queries = {name: (x, ()) if isinstance(x, str) else x for name, x in queries.items()}
+    problems = {name: scans for name, (sqlstr, params) in queries.items() if (scans := full_scans(conn, sqlstr, params))}
+    if problems:
+        details = "\n".join(f"  {name}: {'; '.join(scans)}" for name, scans in problems.items())
+        raise RuntimeError(f"full-table scans on child tables, run db_setup.py to create the indexes:\n{details}")
+
+
+if __name__ == "__main__":
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    setup_database(db_path)
+    conn = connect(db_path)
+    check_query_plans(conn)
+    conn.close()
+    print("indexes created, query plans ok")
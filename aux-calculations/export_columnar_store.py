@@ -0,0 +1,122 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from queries import DB_PATH, INCIDENT_LOOKUPS, PARTICIPANT_LOOKUPS, PASSENGER_LOOKUPS
+from db_setup import connect
+
+
+STORE_PATH = "database/path/columnar"
+CHUNK_SIZE = 500_000
+
+# child tables get the incident year so they are partitioned the same way as the incidents
+EXPORTS = {
+    "incidents": """
+        SELECT * FROM zzz_incidents
+        WHERE type_id IS NOT NULL;
+    """,
+    "participants": """
+        SELECT zzz_participants.*, zzz_incidents.year
+        FROM zzz_participants
+        INNER JOIN zzz_incidents ON zzz_participants.incident_id = zzz_incidents.incident_id
+        WHERE zzz_incidents.type_id IS NOT NULL;
+    """,
+    "passengers": """
+        SELECT zzz_passengers.*, zzz_incidents.year
+        FROM zzz_passengers
+        INNER JOIN zzz_incidents ON zzz_passengers.incident_id = zzz_incidents.incident_id
+        WHERE zzz_incidents.type_id IS NOT NULL;
+    """,
+}
+
+
+def export_store(db_path=DB_PATH, store_path=STORE_PATH, chunk_size=CHUNK_SIZE):
+    if os.path.exists(store_path):
+        shutil.rmtree(store_path)
+    os.makedirs(os.path.join(store_path, "lookups"))
+
+    conn = connect(db_path)
+
+    # lookup tables are written once, as (key, value) pairs
+    for _, table, key, value, _ in INCIDENT_LOOKUPS + PARTICIPANT_LOOKUPS + PASSENGER_LOOKUPS:
+        columns = f"{key} AS nid, {value} AS value" if value else f"{key} AS nid"
+        df_lookup = pd.read_sql_query(f"SELECT {columns} FROM {table} ORDER BY {key}", conn)
+        pq.write_table(pa.Table.from_pandas(df_lookup, preserve_index=False), os.path.join(store_path, "lookups", f"{table}.parquet"))
+
+    # *_id columns stay integer codes, tables are partitioned by year
+    for name, sqlstr in EXPORTS.items():
+        for chunk in pd.read_sql_query(sqlstr, conn, chunksize=chunk_size):
+            pq.write_to_dataset(
+                pa.Table.from_pandas(chunk, preserve_index=False),
+                os.path.join(store_path, name),
+                partition_cols=["year"],
+            )
+
+    conn.close()
+
+
+def read_lookup(table, store_path=STORE_PATH):
+    return pq.read_table(os.path.join(store_path, "lookups", f"{table}.parquet"), memory_map=True).to_pandas()
+
+
+def decode(df, lookups, store_path=STORE_PATH, inner=True):
+    # turn integer codes into categoricals backed by the lookup dictionaries
+    keep = np.ones(len(df), dtype=bool)
+    for id_column, table, _, value, output in lookups:
+        if id_column not in df.columns:
+            continue
+        df_lookup = read_lookup(table, store_path)
+        nids = df_lookup["nid"].to_numpy()
+        ids = df[id_column].to_numpy(dtype="float64")
+        positions = np.searchsorted(nids, ids).clip(0, len(nids) - 1)
+        found = ~np.isnan(ids)
+        found[found] = len(nids) > 0 and nids[positions[found]] == ids[found]
+        keep &= found
+        if output:
+            values = df_lookup["value"]
+            if values.is_unique and values.notna().all():
+                df[output] = pd.Categorical.from_codes(np.where(found, positions, -1), categories=values)
+            else:
+                df[output] = pd.Series(values.to_numpy()[positions], index=df.index).where(found)
+    if inner:
+        df = df[keep].reset_index(drop=True)
+    return df
+
+
+def load_table(name, columns=None, filters=None, store_path=STORE_PATH):
+    table = pq.read_table(os.path.join(store_path, name), columns=columns, filters=filters, memory_map=True)
+    df = table.to_pandas()
+    if "year" in df.columns:
+        df["year"] = df["year"].astype("int64")
+    return df
+
+
+def load_incidents(columns=None, filters=None, store_path=STORE_PATH):
+    # same rows and columns as the main 16-way JOIN in calculate_accidents_stats.py
+    id_columns = [x[0] for x in INCIDENT_LOOKUPS]
+    raw_columns = None if columns is None else list(dict.fromkeys(
+        ["incident_id"] + id_columns + [x for x in columns if x not in {l[4] for l in INCIDENT_LOOKUPS}]
+    ))
+    df = load_table("incidents", raw_columns, filters, store_path)
+    df = decode(df, INCIDENT_LOOKUPS, store_path)
+    if columns is not None:
+        df = df[columns]
+    return df
+
+
+def load_participants(columns=None, filters=None, store_path=STORE_PATH):
+    df = load_table("participants", columns, filters, store_path)
+    return decode(df, PARTICIPANT_LOOKUPS, store_path, inner=False)
+
+
+def load_passengers(columns=None, filters=None, store_path=STORE_PATH):
+    df = load_table("passengers", columns, filters, store_path)
+    return decode(df, PASSENGER_LOOKUPS, store_path, inner=False)
+
+
+if __name__ == "__main__":
+    export_store()
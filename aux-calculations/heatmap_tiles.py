@@ -0,0 +1,99 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from build_cube import FLAGS, flag_codes
+
+
+# web mercator tiles, every tile is split into 2**CELL_BITS x 2**CELL_BITS cells
+ZOOMS = range(5, 12)
+CELL_BITS = 6
+# incidents outside of Poland are geocoding errors
+BBOX = {"lat": (48.9, 55.0), "lng": (14.0, 24.3)}
+
+
+def mercator(lat, lng, zoom):
+    # fractional tile coordinates at the given zoom
+    n = 2 ** zoom
+    x = (lng + 180) / 360 * n
+    y = (1 - np.arcsinh(np.tan(np.radians(lat))) / np.pi) / 2 * n
+    return x, y
+
+
+def inverse_mercator(x, y, zoom):
+    n = 2 ** zoom
+    lng = x / n * 360 - 180
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y / n))))
+    return lat, lng
+
+
+def located(df):
+    lat, lng = df["lat"].to_numpy(dtype="float64"), df["lng"].to_numpy(dtype="float64")
+    return (lat >= BBOX["lat"][0]) & (lat <= BBOX["lat"][1]) & (lng >= BBOX["lng"][0]) & (lng <= BBOX["lng"][1])
+
+
+def aggregate_cells(df, zoom, cell_bits=CELL_BITS):
+    # counts per (cell, year, flags) - cells are global coordinates at zoom + cell_bits
+    x, y = mercator(df["lat"].to_numpy(dtype="float64"), df["lng"].to_numpy(dtype="float64"), zoom + cell_bits)
+    cell_x, cell_y = x.astype(np.int64), y.astype(np.int64)
+    year = df["year"].to_numpy(dtype=np.int64)
+    first_year = int(year.min())
+    flags = flag_codes(df)
+
+    # one linear key per incident: cell_x | cell_y | year | flags
+    coord_bits = zoom + cell_bits
+    flag_bits, year_bits = len(FLAGS), 7
+    key = (((cell_x << coord_bits) | cell_y) << year_bits | (year - first_year)) << flag_bits | flags
+    keys, counts = np.unique(key, return_counts=True)
+
+    flags = keys & ((1 << flag_bits) - 1)
+    keys >>= flag_bits
+    year = (keys & ((1 << year_bits) - 1)) + first_year
+    keys >>= year_bits
+    return pd.DataFrame({
+        "cell_x": keys >> coord_bits,
+        "cell_y": keys & ((1 << coord_bits) - 1),
+        "year": year,
+        "flags": flags,
+        "count": counts,
+    })
+
+
+def export_tiles(df, output_path, zooms=ZOOMS, cell_bits=CELL_BITS):
+    # static tiles {zoom}/{x}/{y}.json, cells as [x in tile, y in tile, year, flags, count]
+    df = df[located(df)]
+    cell_mask = (1 << cell_bits) - 1
+    for zoom in zooms:
+        df_cells = aggregate_cells(df, zoom, cell_bits)
+        # pandas has no shift operators on Series
+        df_cells["tile_x"] = df_cells["cell_x"].to_numpy() >> cell_bits
+        df_cells["tile_y"] = df_cells["cell_y"].to_numpy() >> cell_bits
+        df_cells["cell_x"] &= cell_mask
+        df_cells["cell_y"] &= cell_mask
+        for (tile_x, tile_y), df_tile in df_cells.groupby(["tile_x", "tile_y"]):
+            os.makedirs(os.path.join(output_path, str(zoom), str(tile_x)), exist_ok=True)
+            with open(os.path.join(output_path, str(zoom), str(tile_x), f"{tile_y}.json"), "w") as f:
+                json.dump(df_tile[["cell_x", "cell_y", "year", "flags", "count"]].to_numpy().tolist(), f, separators=(",", ":"))
+
+    with open(os.path.join(output_path, "index.json"), "w") as f:
+        json.dump({
+            "zooms": list(zooms),
+            "cell_bits": cell_bits,
+            "flags": list(FLAGS),
+            "years": sorted(int(x) for x in df["year"].unique()),
+        }, f, indent=2)
+
+
+def cell_centers(df, zoom, cell_bits=CELL_BITS, year=None, flags=()):
+    # [lat, lng, count] per cell, for folium's HeatMap instead of one point per incident
+    df = df[located(df)]
+    df_cells = aggregate_cells(df, zoom, cell_bits)
+    if year is not None:
+        df_cells = df_cells[df_cells["year"] == year]
+    mask = sum(1 << list(FLAGS).index(x) for x in flags)
+    df_cells = df_cells[(df_cells["flags"] & mask) == mask]
+    df_cells = df_cells.groupby(["cell_x", "cell_y"])["count"].sum().reset_index()
+    lat, lng = inverse_mercator(df_cells["cell_x"] + 0.5, df_cells["cell_y"] + 0.5, zoom + cell_bits)
+    return np.column_stack([lat, lng, df_cells["count"]]).tolist()
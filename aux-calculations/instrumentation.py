@@ -0,0 +1,167 @@
+import cProfile
+import datetime
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+# spans record wall / cpu time, rows in and out, peak RSS and optionally tracemalloc deltas, with the cpu time and
+# the largest peak of the child processes (process pools, loky workers) kept apart from the process' own;
+# top-level spans can also be profiled with cProfile (.prof files open in snakeviz, or flameprof for a flamegraph)
+SETTINGS = {"tracemalloc": False, "profile_dir": None}
+SPANS = []
+_open = []
+
+
+def configure(tracemalloc_enabled=False, profile_dir=None):
+    SETTINGS["tracemalloc"] = tracemalloc_enabled
+    SETTINGS["profile_dir"] = profile_dir
+    SPANS.clear()
+    if tracemalloc_enabled and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+
+
+def _reset_peak_rss(pid="self"):
+    # linux: writing 5 to clear_refs resets VmHWM, so every span gets its own peak
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _rss_mb(field, pid="self"):
+    # VmRSS / VmHWM from /proc, falls back to the lifetime peak of getrusage (0 for an exited child)
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if pid != "self":
+        return 0.0
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def _children():
+    # {pid: (cpu seconds incl. the children it waited for, peak RSS MB)} of the live child processes,
+    # e.g. the loky workers joblib keeps between calls; empty where /proc is missing
+    pids = []
+    try:
+        for task in os.listdir("/proc/self/task"):
+            with open(f"/proc/self/task/{task}/children") as f:
+                pids.extend(int(x) for x in f.read().split())
+    except OSError:
+        return {}
+    usage = {}
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                # utime, stime, cutime, cstime - fields 14 to 17, counted here from the state (field 3)
+                fields = f.read().rsplit(")", 1)[1].split()
+            cpu = sum(int(x) for x in fields[11:15]) / os.sysconf("SC_CLK_TCK")
+        except (OSError, IndexError, ValueError):
+            continue
+        usage[pid] = (cpu, _rss_mb("VmHWM", pid))
+    return usage
+
+
+def _reaped():
+    # (cpu seconds, largest peak RSS MB) of the child processes already waited for - pools shut down in a span
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss / scale
+
+
+def rows(rows_in=None, rows_out=None):
+    # row counts of the innermost open span
+    if _open:
+        if rows_in is not None:
+            _open[-1]["rows_in"] = int(rows_in)
+        if rows_out is not None:
+            _open[-1]["rows_out"] = int(rows_out)
+
+
+@contextmanager
+def span(name, **attributes):
+    record = {"name": name, "parent": _open[-1]["name"] if _open else None, "rows_in": None, "rows_out": None, **attributes}
+    # the peaks are reset below, so the parent keeps what it reached so far
+    if _open:
+        _open[-1]["_peak"] = max(_open[-1]["_peak"], _rss_mb("VmHWM"))
+        _open[-1]["_children_peak"] = max([_open[-1]["_children_peak"], *(x[1] for x in _children().values())])
+        if SETTINGS["tracemalloc"]:
+            _open[-1]["_traced_peak"] = max(_open[-1]["_traced_peak"], tracemalloc.get_traced_memory()[1])
+    record["peak_reset"] = _reset_peak_rss()
+    for pid in _children():
+        _reset_peak_rss(pid)
+    record["rss_mb_start"] = _rss_mb("VmRSS")
+    record["_peak"] = record["_traced_peak"] = record["_children_peak"] = 0
+    children, reaped = _children(), _reaped()
+    if SETTINGS["tracemalloc"]:
+        tracemalloc.reset_peak()
+        traced_start = tracemalloc.get_traced_memory()[0]
+    profiler = None
+    if SETTINGS["profile_dir"] and not _open:
+        profiler = cProfile.Profile()
+    _open.append(record)
+    wall, cpu = time.perf_counter(), time.process_time()
+    if profiler:
+        profiler.enable()
+    try:
+        yield record
+        record["status"] = record.get("status", "ok")
+    except BaseException as e:
+        record["status"] = f"error: {type(e).__name__}"
+        raise
+    finally:
+        if profiler:
+            profiler.disable()
+            record["profile"] = os.path.join(SETTINGS["profile_dir"], f"{name}.prof")
+            profiler.dump_stats(record["profile"])
+        record["wall_s"] = time.perf_counter() - wall
+        record["cpu_s"] = time.process_time() - cpu
+        # children reaped in the span count with their whole lifetime, the part before the span is taken off
+        children_end, reaped_end = _children(), _reaped()
+        record["cpu_children_s"] = max(0.0, reaped_end[0] - reaped[0]
+            + sum(x[0] - children.get(pid, (0, 0))[0] for pid, x in children_end.items())
+            - sum(x[0] for pid, x in children.items() if pid not in children_end))
+        record["rss_mb_end"] = _rss_mb("VmRSS")
+        # nested spans reset the high-water mark, so their peaks are folded into the parent
+        record["peak_rss_mb"] = max(_rss_mb("VmHWM"), record.pop("_peak"))
+        # the peak of the reaped children is their lifetime maximum, it belongs to the span only if it went up
+        record["peak_rss_children_mb"] = max([
+            record.pop("_children_peak"), *(x[1] for x in children_end.values()),
+            reaped_end[1] if reaped_end[1] > reaped[1] else 0,
+        ])
+        traced_peak = record.pop("_traced_peak")
+        if SETTINGS["tracemalloc"]:
+            current, peak = tracemalloc.get_traced_memory()
+            traced_peak = max(peak, traced_peak)
+            record["tracemalloc_delta_mb"] = (current - traced_start) / 2 ** 20
+            record["tracemalloc_peak_mb"] = (traced_peak - traced_start) / 2 ** 20
+        _open.pop()
+        if _open:
+            _open[-1]["_peak"] = max(_open[-1]["_peak"], record["peak_rss_mb"])
+            _open[-1]["_children_peak"] = max(_open[-1]["_children_peak"], record["peak_rss_children_mb"])
+            _open[-1]["_traced_peak"] = max(_open[-1]["_traced_peak"], traced_peak)
+        SPANS.append(record)
+
+
+def write_trace(path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({
+            "written": datetime.datetime.now().isoformat(timespec="seconds"),
+            "argv": sys.argv,
+            "tracemalloc": SETTINGS["tracemalloc"],
+            "spans": SPANS,
+        }, f, indent=2)
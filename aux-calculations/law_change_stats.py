@@ -0,0 +1,125 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from law_changes import LAW_CHANGES, daily_combination_counts
+
+
+# every window of a law change is compared with its "before" window
+BASELINE_WINDOW = "before"
+# weekly blocks keep the day-of-week pattern inside the resampled series
+BLOCK_DAYS = 7
+N_BOOTSTRAP = 10_000
+N_PERMUTATIONS = 10_000
+CONFIDENCE = 0.95
+
+
+def block_sums(daily, block_days=BLOCK_DAYS):
+    # sum of the block starting at every day, blocks wrap around the end of the window (circular bootstrap)
+    wrapped = np.concatenate([daily, daily[:block_days]])
+    cumulative = np.concatenate([[0], np.cumsum(wrapped, dtype=np.float64)])
+    return cumulative[block_days:block_days + len(daily)] - cumulative[:len(daily)]
+
+
+def bootstrap_sums(rng, series, n_bootstrap, block_days=BLOCK_DAYS):
+    # resampled window totals of every series (same block starts for all of them, so ratios stay paired),
+    # shape series x n_bootstrap; the last block is cut so every replicate covers exactly len(window) days
+    n_days = len(series[0])
+    n_blocks, last = divmod(n_days, block_days)
+    starts = rng.integers(0, n_days, size=(n_bootstrap, n_blocks + (last > 0)))
+    totals = []
+    for daily in series:
+        sums = block_sums(daily, block_days)[starts[:, :n_blocks]].sum(axis=1)
+        if last:
+            sums += block_sums(daily, last)[starts[:, -1]]
+        totals.append(sums)
+    return np.array(totals)
+
+
+def full_blocks(daily, block_days=BLOCK_DAYS):
+    n_blocks = len(daily) // block_days
+    return daily[:n_blocks * block_days].reshape(n_blocks, block_days).sum(axis=1).astype(np.float64)
+
+
+def permutation_ratios(rng, baseline, window, n_permutations, block_days=BLOCK_DAYS):
+    # (observed, permuted) daily-mean ratios window / baseline for every series (rows), with weekly blocks
+    # shuffled between the two windows - all permutations at once as a random key matrix sorted per row
+    baseline_blocks = np.array([full_blocks(x, block_days) for x in baseline])
+    window_blocks = np.array([full_blocks(x, block_days) for x in window])
+    pooled = np.concatenate([baseline_blocks, window_blocks], axis=1)
+    n_baseline = baseline_blocks.shape[1]
+
+    observed = window_blocks.mean(axis=1) / baseline_blocks.mean(axis=1)
+    order = np.argsort(rng.random((n_permutations, pooled.shape[1])), axis=1)
+    shuffled = pooled[:, order]  # series x permutations x blocks
+    permuted = shuffled[:, :, n_baseline:].mean(axis=2) / shuffled[:, :, :n_baseline].mean(axis=2)
+    return observed, permuted
+
+
+def p_value(observed, permuted):
+    # two-sided, on the log ratio; NaN when the observed ratio is undefined (no accidents in either window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        distance = np.abs(np.log(permuted))
+        p = (1 + (distance >= np.abs(np.log(observed))[..., None]).sum(axis=-1)) / (permuted.shape[-1] + 1)
+    return np.where(np.isnan(observed), np.nan, p)
+
+
+def compare_windows(task):
+    # one (law change, subgroup, window) comparison: ratios of the monthly average and of the share vs the baseline
+    seed, key, baseline, window, n_bootstrap, n_permutations, confidence = task
+    rng = np.random.default_rng(seed)
+    (base_sub, base_total, base_months), (sub, total, months) = baseline, window
+
+    base_sums = bootstrap_sums(rng, [base_sub, base_total], n_bootstrap)
+    sums = bootstrap_sums(rng, [sub, total], n_bootstrap)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_ratio = (sums[0] / months) / (base_sums[0] / base_months)
+        share_ratio = (sums[0] / sums[1]) / (base_sums[0] / base_sums[1])
+
+    observed, permuted = permutation_ratios(rng, [base_sub, base_total], [sub, total], n_permutations)
+    # share ratio of every permutation - subgroup ratio / total ratio, both from the same shuffled blocks
+    share_observed, share_permuted = observed[0] / observed[1], permuted[0] / permuted[1]
+
+    alpha = (1 - confidence) / 2
+    rows = []
+    for metric, point, samples, test in [
+        ("avg_count", (sub.sum() / months) / (base_sub.sum() / base_months), avg_ratio, p_value(observed[0], permuted[0])),
+        ("share", (sub.sum() / total.sum()) / (base_sub.sum() / base_total.sum()), share_ratio, p_value(share_observed, share_permuted)),
+    ]:
+        low, high = np.nanquantile(samples, [alpha, 1 - alpha])
+        rows.append({**key, "metric": metric, "ratio": point, "ci_low": low, "ci_high": high, "p_value": float(test)})
+    return rows
+
+
+def law_change_stats(df, law_changes=LAW_CHANGES, date_column="date_formatted", n_bootstrap=N_BOOTSTRAP,
+                     n_permutations=N_PERMUTATIONS, confidence=CONFIDENCE, seed=0, max_workers=None):
+    # block bootstrap CIs and permutation p-values for the window / "before" ratios printed by the stats script,
+    # from the daily series only - the incidents are scanned once for the daily counts
+    predicates = sorted({p for x in law_changes for subgroup in x["subgroups"].values() for p in subgroup})
+    first_day, counts = daily_combination_counts(df, predicates, date_column)
+    codes = np.arange(counts.shape[1])
+    total = counts.sum(axis=1)
+
+    def day_index(date):
+        return int(np.clip((np.datetime64(date, "D") - first_day).astype(np.int64), 0, len(counts)))
+
+    tasks = []
+    for law_change in law_changes:
+        windows = {k: (day_index(start), day_index(end), months) for k, (start, end, months) in law_change["windows"].items()}
+        start, end, base_months = windows[BASELINE_WINDOW]
+        for subgroup, subgroup_predicates in law_change["subgroups"].items():
+            mask = sum(1 << predicates.index(p) for p in subgroup_predicates)
+            daily = counts[:, (codes & mask) == mask].sum(axis=1)
+            baseline = (daily[start:end], total[start:end], base_months)
+            for window, (window_start, window_end, months) in windows.items():
+                if window == BASELINE_WINDOW:
+                    continue
+                key = {"law_change": law_change["name"], "subgroup": subgroup, "window": window, "baseline": BASELINE_WINDOW}
+                tasks.append([key, baseline, (daily[window_start:window_end], total[window_start:window_end], months)])
+
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+    tasks = [(s, *task, n_bootstrap, n_permutations, confidence) for s, task in zip(seeds, tasks)]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(compare_windows, tasks))
+    return pd.DataFrame([row for rows in results for row in rows])
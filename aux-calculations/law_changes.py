@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+
+# law changes analysed in the article
+# windows: name -> (first day, day after the last day, number of months used for the monthly average)
+# subgroups: name -> list of boolean columns that all have to be True, an empty list means all accidents
+LAW_CHANGES = [
+    {
+        "name": "bicycles",
+        "intro_date": "2011-05-21",
+        "windows": {
+            "before": ("2010-05-21", "2011-05-21", 12),
+            "in_year_of_intro": ("2011-05-21", "2012-05-21", 12),
+            "in_following_years": ("2012-05-21", "2022-05-21", 120),
+        },
+        "subgroups": {
+            "all": [],
+            "accidents": ["involved_bicycle"],
+            "injury": ["involved_bicycle", "injury_any"],
+        },
+    },
+    {
+        "name": "alcohol",
+        "intro_date": "2015-05-18",
+        "windows": {
+            "before": ("2014-05-18", "2015-05-18", 12),
+            "in_year_of_intro": ("2015-05-18", "2016-05-18", 12),
+            "in_following_years": ("2016-05-18", "2022-05-18", 72),
+        },
+        "subgroups": {
+            "all": [],
+            "accidents": ["intoxicated_alcohol"],
+            "injury": ["intoxicated_alcohol", "injury_severe"],
+        },
+    },
+    {
+        "name": "pedestrians",
+        "intro_date": "2021-06-01",
+        "windows": {
+            "previous_years": ("2010-06-01", "2020-05-31", 120),
+            "before": ("2020-06-01", "2021-05-31", 12),
+            "in_year_of_intro": ("2021-06-01", "2022-05-31", 12),
+        },
+        "subgroups": {
+            "all": [],
+            "accidents": ["pedestrian_crossing", "involved_pedestrian"],
+            "injury": ["pedestrian_crossing", "involved_pedestrian", "injury_any"],
+        },
+    },
+]
+
+
+def daily_combination_counts(df, predicates, date_column="date_formatted"):
+    # one pass over the frame: every row gets a bit code of the predicates it satisfies,
+    # then a single bincount gives counts per (day, predicate combination)
+    code = np.zeros(len(df), dtype=np.int64)
+    for bit, name in enumerate(predicates):
+        code |= df[name].to_numpy(dtype=bool).astype(np.int64) << bit
+    n_codes = 1 << len(predicates)
+
+    days = df[date_column].to_numpy(dtype="datetime64[D]")
+    first_day = days.min()
+    offsets = (days - first_day).astype(np.int64)
+    n_days = int(offsets.max()) + 1
+
+    counts = np.bincount(offsets * n_codes + code, minlength=n_days * n_codes).reshape(n_days, n_codes)
+    return first_day, counts
+
+
+def law_change_counts(df, law_changes=LAW_CHANGES, date_column="date_formatted"):
+    predicates = sorted({p for x in law_changes for subgroup in x["subgroups"].values() for p in subgroup})
+    first_day, counts = daily_combination_counts(df, predicates, date_column)
+
+    # prefix sums over the date-sorted days, so every window is a difference of two rows
+    cumulative = np.vstack([np.zeros((1, counts.shape[1]), dtype=np.int64), counts.cumsum(axis=0)])
+    codes = np.arange(counts.shape[1])
+
+    def day_index(date):
+        return int(np.clip((np.datetime64(date, "D") - first_day).astype(np.int64), 0, len(counts)))
+
+    rows = []
+    for law_change in law_changes:
+        for window, (start, end, months) in law_change["windows"].items():
+            window_counts = cumulative[day_index(end)] - cumulative[day_index(start)]
+            total = window_counts.sum()
+            for subgroup, subgroup_predicates in law_change["subgroups"].items():
+                mask = sum(1 << predicates.index(p) for p in subgroup_predicates)
+                count = int(window_counts[(codes & mask) == mask].sum())
+                rows.append({
+                    "law_change": law_change["name"],
+                    "window": window,
+                    "subgroup": subgroup,
+                    "count": count,
+                    "avg_count": count / months,
+                    "share": count / total * 100 if total else np.nan,
+                })
+    return pd.DataFrame(rows)
@@ -0,0 +1,201 @@
+import sqlite3
+import sys
+
+from queries import DB_PATH, INCIDENT_LOOKUPS, PARTICIPANT_LOOKUPS, PASSENGER_LOOKUPS
+from query_loader import read_query, iter_query
+
+
+# lazy queries over accidents.db: a query is a plain dict, every function below returns a new one,
+# nothing runs until collect() - then the whole chain becomes one SQL statement, so SQLite only reads
+# the tables, columns and rows it needs and only the (aggregated) result is materialized
+#
+#   q = scan("passengers")
+#   q = where(q, "penalty", "is not null")
+#   q = group_by(q, ["passenger_type"], count=("count", "*"))
+#   df = collect(conn, q)
+
+# grain -> base table; columns of parent tables (vehicle, incident) are joined only when referenced
+GRAINS = {"incidents": "zzz_incidents", "vehicles": "zzz_participants", "passengers": "zzz_passengers"}
+PARENTS = {
+    "zzz_incidents": {},
+    "zzz_participants": {"zzz_incidents": "zzz_participants.incident_id = zzz_incidents.incident_id"},
+    "zzz_passengers": {
+        "zzz_participants": "zzz_passengers.vehicle_id = zzz_participants.nid",
+        "zzz_incidents": "zzz_passengers.incident_id = zzz_incidents.incident_id",
+    },
+}
+# decoded lookup columns: name -> (table holding the id, id column, lookup table, key column, value column)
+LOOKUPS = {
+    output: (table, id_column, lookup, key, value)
+    for table, lookups in [("zzz_incidents", INCIDENT_LOOKUPS), ("zzz_participants", PARTICIPANT_LOOKUPS), ("zzz_passengers", PASSENGER_LOOKUPS)]
+    for id_column, lookup, key, value, output in lookups if output
+}
+COMPARISONS = ["=", "!=", "<", "<=", ">", ">=", "like"]
+AGGREGATES = {"count": "COUNT({})", "count_distinct": "COUNT(DISTINCT {})", "sum": "SUM({})", "avg": "AVG({})", "min": "MIN({})", "max": "MAX({})"}
+
+
+def scan(grain):
+    if grain not in GRAINS:
+        raise ValueError(f"unknown grain {grain}, expected one of {list(GRAINS)}")
+    return {"grain": grain, "filters": [], "derived": {}, "columns": None, "keys": None, "aggregates": None, "limit": None}
+
+
+def where(query, column, op, value=None):
+    # column op value, op - one of COMPARISONS, "in", "not in", "is null", "is not null"
+    return {**query, "filters": query["filters"] + [("predicate", column, op.lower(), value)]}
+
+
+def semi_join(query, other, column, other_column=None):
+    # rows whose column value appears in other - e.g. passengers of incidents where anybody got a penalty
+    other = {**other, "columns": [other_column or column], "keys": None, "aggregates": None}
+    return {**query, "filters": query["filters"] + [("in", column, None, other)]}
+
+
+def derive(query, name, column, op, value=None):
+    # new column: 0 / 1 for a comparison, or "fill" - the value where column is NULL or empty
+    return {**query, "derived": {**query["derived"], name: (column, op.lower(), value)}}
+
+
+def select(query, columns):
+    return {**query, "columns": list(columns)}
+
+
+def group_by(query, keys, **aggregates):
+    # aggregates: output column -> (function, column), function - one of AGGREGATES, column "*" for count
+    return {**query, "keys": list(keys), "aggregates": aggregates}
+
+
+def limit(query, n):
+    return {**query, "limit": n}
+
+
+def _table_columns(conn, table, cache):
+    if table not in cache:
+        cache[table] = {x[1] for x in conn.execute(f"PRAGMA table_info({table})")}
+    return cache[table]
+
+
+def _compile(conn, query, cache):
+    # (sql, params), params in the order of the placeholders in the statement
+    base = GRAINS[query["grain"]]
+    joins = {}
+
+    def resolve(name, params):
+        if name in query["derived"]:
+            column, op, value = query["derived"][name]
+            expr = resolve(column, params)
+            if op == "fill":
+                params.append(value)
+                return f"COALESCE(NULLIF({expr}, ''), ?)"
+            return f"(CASE WHEN {condition(expr, op, value, params)} THEN 1 ELSE 0 END)"
+        if "." in name:
+            table, column = name.split(".", 1)
+        elif name in LOOKUPS:
+            table, id_column, lookup, key, value = LOOKUPS[name]
+            use_table(table)
+            joins[lookup] = f"LEFT JOIN {lookup} ON {table}.{id_column} = {lookup}.{key}"
+            return f"{lookup}.{value}"
+        else:
+            tables = [x for x in [base, *PARENTS[base]] if name in _table_columns(conn, x, cache)]
+            if not tables:
+                raise KeyError(f"column {name} not found in {base} or its parent tables")
+            table, column = tables[0], name
+        use_table(table)
+        return f"{table}.{column}"
+
+    def use_table(table):
+        if table == base:
+            return
+        if table not in PARENTS[base]:
+            raise ValueError(f"{table} is not a parent of {base}, scan a finer grain instead")
+        # parent joins are INNER, same as the queries in queries.py, and go before the lookups
+        joins.setdefault(table, f"INNER JOIN {table} ON {PARENTS[base][table]}")
+
+    def condition(expr, op, value, params):
+        if op in COMPARISONS:
+            params.append(value)
+            return f"{expr} {op.upper()} ?"
+        if op in ("in", "not in"):
+            params.extend(value)
+            return f"{expr} {op.upper()} ({', '.join('?' * len(value))})"
+        if op in ("is null", "is not null"):
+            return f"{expr} {op.upper()}"
+        raise ValueError(f"unknown operator {op}")
+
+    select_params, where_params = [], []
+    if query["keys"] is not None:
+        outputs = [f"{resolve(x, select_params)} AS {x.split('.')[-1]}" for x in query["keys"]]
+        for name, (function, column) in query["aggregates"].items():
+            expr = "*" if column == "*" else resolve(column, select_params)
+            outputs.append(f"{AGGREGATES[function].format(expr)} AS {name}")
+    else:
+        outputs = [f"{resolve(x, select_params)} AS {x.split('.')[-1]}" for x in query["columns"]]
+
+    conditions = []
+    for kind, column, op, value in query["filters"]:
+        expr = resolve(column, where_params)
+        if kind == "in":
+            sqlstr, sub_params = _compile(conn, value, cache)
+            conditions.append(f"{expr} IN ({sqlstr})")
+            where_params.extend(sub_params)
+        else:
+            conditions.append(condition(expr, op, value, where_params))
+
+    # parent tables first, so the lookups can refer to them
+    order = sorted(joins, key=lambda x: x not in PARENTS[base])
+    sqlstr = f"SELECT {', '.join(outputs)} FROM {base} " + " ".join(joins[x] for x in order)
+    if conditions:
+        sqlstr += " WHERE " + " AND ".join(conditions)
+    if query["keys"]:
+        positions = ", ".join(str(i + 1) for i in range(len(query["keys"])))
+        sqlstr += f" GROUP BY {positions} ORDER BY {positions}"
+    if query["limit"] is not None:
+        sqlstr += f" LIMIT {int(query['limit'])}"
+    return sqlstr, select_params + where_params
+
+
+def to_sql(conn, query):
+    if query["keys"] is None and not query["columns"]:
+        raise ValueError("select() the columns or group_by() before running a query")
+    return _compile(conn, query, {})
+
+
+def explain(conn, query):
+    sqlstr, params = to_sql(conn, query)
+    return [x[3] for x in conn.execute("EXPLAIN QUERY PLAN " + sqlstr, params).fetchall()]
+
+
+def output_dtypes(query):
+    # default dtypes of the result: 0 / 1 columns as bool, lookups as category, counts as int64
+    def dtype(name):
+        if name in query["derived"]:
+            return "object" if query["derived"][name][1] == "fill" else "bool"
+        return "category" if name in LOOKUPS else "object"
+
+    if query["keys"] is None:
+        return {x.split(".")[-1]: dtype(x) for x in query["columns"]}
+    aggregates = {name: "int64" if function.startswith("count") else "float64" for name, (function, _) in query["aggregates"].items()}
+    return {**{x.split(".")[-1]: dtype(x) for x in query["keys"]}, **aggregates}
+
+
+def collect(conn, query, dtypes=None):
+    # runs the query, memory in proportion to the result - aggregate first for large tables
+    sqlstr, params = to_sql(conn, query)
+    return read_query(conn, sqlstr, {**output_dtypes(query), **(dtypes or {})}, params=params)
+
+
+def iter_collect(conn, query, dtypes=None, batch_size=100_000):
+    # same as collect, one DataFrame per batch of rows
+    sqlstr, params = to_sql(conn, query)
+    yield from iter_query(conn, sqlstr, {**output_dtypes(query), **(dtypes or {})}, batch_size, params)
+
+
+if __name__ == "__main__":
+    # python lazy_query.py [db path] - example: passengers by type and penalty
+    conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else DB_PATH)
+    q = where(scan("passengers"), "type_id", "is not null")
+    q = group_by(q, ["passenger_type", "penalty"], count=("count", "*"))
+    print(to_sql(conn, q)[0])
+    print("\n".join(explain(conn, q)))
+    print(collect(conn, q))
+    conn.close()
@@ -0,0 +1,104 @@
+import datetime
+import json
+import os
+import pickle
+import re
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+
+# fitted pipelines + metadata, one <name>-<data hash>.pkl / .json pair per model and training set
+STORE_PATH = "output/path/models"
+FORMAT_VERSION = 1
+
+
+def slug(name):
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+
+
+def save_model(model, name, features, training_window, training_hash, store_path=STORE_PATH, **extra):
+    # training_window - (first period, last period) of the training rows
+    os.makedirs(store_path, exist_ok=True)
+    base = os.path.join(store_path, f"{slug(name)}-{training_hash[:12]}")
+    metadata = {
+        "format_version": FORMAT_VERSION,
+        "name": name,
+        "estimator": type(model[-1]).__name__,
+        "steps": [type(x).__name__ for x in model],
+        "features": list(features),
+        "training_window": [str(x) for x in training_window],
+        "data_hash": training_hash,
+        "sklearn": sklearn.__version__,
+        "saved": datetime.datetime.now().isoformat(timespec="seconds"),
+        **extra,
+    }
+    with open(base + ".pkl", "wb") as f:
+        pickle.dump(model, f)
+    with open(base + ".json", "w") as f:
+        json.dump(metadata, f, indent=2, default=str)
+
+    # latest model per name
+    index_path = os.path.join(store_path, "index.json")
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+    index[name] = os.path.basename(base)
+    with open(index_path, "w") as f:
+        json.dump(index, f, indent=2)
+    return metadata
+
+
+def load_model(name, store_path=STORE_PATH, training_hash=None):
+    # (model, metadata) - the latest model of that name, or the one trained on training_hash
+    if training_hash is None:
+        with open(os.path.join(store_path, "index.json")) as f:
+            base = os.path.join(store_path, json.load(f)[name])
+    else:
+        base = os.path.join(store_path, f"{slug(name)}-{training_hash[:12]}")
+    with open(base + ".json") as f:
+        metadata = json.load(f)
+    if metadata["format_version"] != FORMAT_VERSION:
+        raise ValueError(f"{name}: model format {metadata['format_version']}, expected {FORMAT_VERSION}")
+    if metadata["sklearn"] != sklearn.__version__:
+        print(f"{name}: saved with scikit-learn {metadata['sklearn']}, running {sklearn.__version__}")
+    with open(base + ".pkl", "rb") as f:
+        return pickle.load(f), metadata
+
+
+def scenario_frames(X, scenarios):
+    # every scenario stacked into one frame, scenario -> {column: value or function of the column}
+    frames = []
+    for changes in scenarios.values():
+        X_x = X.copy()
+        for column, change in changes.items():
+            X_x[column] = change(X_x[column]) if callable(change) else change
+        frames.append(X_x)
+    return pd.concat(frames, ignore_index=True)
+
+
+def predict_scenarios(model, metadata, X, scenarios):
+    # predictions for every row x scenario in a single predict call, columns = baseline + scenarios, index = X.index
+    scenarios = {"baseline": {}, **scenarios}
+    predictions = model.predict(scenario_frames(X, scenarios)[metadata["features"]])
+    return pd.DataFrame(predictions.reshape(len(scenarios), len(X)).T, index=X.index, columns=list(scenarios))
+
+
+def effects_by_date(periods, actual, df_predictions, dates):
+    # mean monthly (actual - predicted) before and after every candidate date for every scenario,
+    # one broadcast over scenarios x dates x periods; actual can be any accident subset on the same periods
+    periods = pd.to_datetime(pd.Series(periods)).to_numpy()
+    residuals = np.asarray(actual, dtype=np.float64)[None, None, :] - df_predictions.to_numpy(dtype=np.float64).T[:, None, :]
+    after = periods[None, :] >= pd.to_datetime(pd.Series(dates)).to_numpy()[:, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_after = (residuals * after).sum(axis=2) / after.sum(axis=1)
+        mean_before = (residuals * ~after).sum(axis=2) / (~after).sum(axis=1)
+    return pd.DataFrame({
+        "scenario": np.repeat(df_predictions.columns.to_numpy(), len(dates)),
+        "date": np.tile([str(x) for x in dates], len(df_predictions.columns)),
+        "before": mean_before.ravel(),
+        "after": mean_after.ravel(),
+        "difference": (mean_after - mean_before).ravel(),
+    })
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import pickle
+
+import pandas as pd
+from joblib import Parallel, delayed, parallel_backend
+
+from sklearn.base import clone
+from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.linear_model import LinearRegression, Ridge, Lasso, HuberRegressor
+from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+from sklearn.preprocessing import StandardScaler, PolynomialFeatures
+from sklearn.pipeline import make_pipeline
+from xgboost import XGBRegressor
+from lightgbm import LGBMRegressor
+from catboost import CatBoostRegressor
+
+
+# preprocessing prefixes shared by the models, each one is fitted once per training set
+PREPROCESSING = {
+    "scaled": lambda: [StandardScaler()],
+    "polynomial": lambda: [PolynomialFeatures(degree=2, include_bias=False), StandardScaler()],
+}
+
+# name -> (preprocessing, estimator, name of the estimator's thread count parameter or None)
+MODELS = {
+    "Linear Regression": ("scaled", LinearRegression(), None),
+    "Polynomial & LinearRegression": ("polynomial", LinearRegression(), None),
+    "Ridge Regression": ("scaled", Ridge(), None),
+    "Lasso Regression": ("scaled", Lasso(), None),
+    "Polynomial & Ridge Regression": ("polynomial", Ridge(), None),
+    "HuberRegressor": ("scaled", HuberRegressor(), None),
+    "Polynomial & HuberRegressor": ("polynomial", HuberRegressor(), None),
+    "Random Forest": ("scaled", RandomForestRegressor(), "n_jobs"),
+    "Polynomial & Random Forest": ("polynomial", RandomForestRegressor(), "n_jobs"),
+    "Gradient Boosting": ("scaled", GradientBoostingRegressor(), None),
+    "Polynomial & Gradient Boosting": ("polynomial", GradientBoostingRegressor(), None),
+    "XGBoost": ("scaled", XGBRegressor(), "n_jobs"),
+    "Polynomial & XGBoost": ("polynomial", XGBRegressor(), "n_jobs"),
+    "LightGBM": ("scaled", LGBMRegressor(verbose=-1), "n_jobs"),
+    "CatBoost": ("scaled", CatBoostRegressor(verbose=0), "thread_count"),
+    "Polynomial & CatBoost": ("polynomial", CatBoostRegressor(verbose=0), "thread_count"),
+}
+
+CACHE_DIR = "output/path/.pipeline/model-cache"
+
+
+def data_hash(*frames):
+    h = hashlib.sha256()
+    for frame in frames:
+        h.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def model_key(name, preprocessing, estimator, training_hash):
+    # model config + training data, thread counts are left out - they don't change the result
+    params = {k: v for k, v in estimator.get_params().items() if k not in ("n_jobs", "thread_count")}
+    config = repr((name, preprocessing, type(estimator).__name__, sorted(params.items(), key=lambda x: x[0])))
+    return hashlib.sha256((config + training_hash).encode()).hexdigest()
+
+
+def _fit(estimator, Xt, y):
+    estimator.fit(Xt, y)
+    return estimator
+
+
+def thread_budget(n_fits, n_threads=None):
+    # (parallel fits, threads per fit) so that their product never exceeds the budget
+    n_threads = n_threads or os.cpu_count() or 1
+    n_workers = max(1, min(n_fits, n_threads))
+    return n_workers, max(1, n_threads // n_workers)
+
+
+def evaluate_models(X, y, X_all, y_all, models=MODELS, cache_dir=CACHE_DIR, n_threads=None):
+    # returns ({name: (mse, r2)}, {name: fitted pipeline}), scores are computed over X_all
+    os.makedirs(cache_dir, exist_ok=True)
+    training_hash = data_hash(X, y)
+    scoring_hash = data_hash(X_all, y_all)
+
+    # distinct preprocessing prefixes, fitted once
+    prefixes = {}
+    for preprocessing in {x[0] for x in models.values()}:
+        steps, Xt, Xt_all = [], X, X_all
+        for step in PREPROCESSING[preprocessing]():
+            Xt = step.fit_transform(Xt)
+            Xt_all = step.transform(Xt_all)
+            steps.append(step)
+        prefixes[preprocessing] = (steps, Xt, Xt_all)
+
+    fitted, results, to_fit = {}, {}, []
+    for name, (preprocessing, estimator, _) in models.items():
+        key = model_key(name, preprocessing, estimator, training_hash)
+        cache_path = os.path.join(cache_dir, key + ".pkl")
+        if os.path.exists(cache_path):
+            with open(cache_path, "rb") as f:
+                cached = pickle.load(f)
+            fitted[name] = cached["model"]
+            if cached["scoring_hash"] == scoring_hash:
+                results[name] = cached["scores"]
+        else:
+            to_fit.append((name, key))
+
+    # fits run across processes, each estimator gets its share of the thread budget
+    n_workers, threads_per_fit = thread_budget(len(to_fit), n_threads)
+    jobs = []
+    for name, _ in to_fit:
+        preprocessing, estimator, thread_param = models[name]
+        estimator = clone(estimator)
+        if thread_param:
+            estimator.set_params(**{thread_param: threads_per_fit})
+        jobs.append(delayed(_fit)(estimator, prefixes[preprocessing][1], y.to_numpy()))
+    with parallel_backend("loky", inner_max_num_threads=threads_per_fit):
+        estimators = Parallel(n_jobs=n_workers)(jobs)
+
+    for (name, key), estimator in zip(to_fit, estimators):
+        steps = prefixes[models[name][0]][0]
+        fitted[name] = make_pipeline(*steps, estimator)
+
+    for name in models:
+        if name in results:
+            continue
+        predictions = fitted[name][-1].predict(prefixes[models[name][0]][2])
+        results[name] = (mean_squared_error(y_all, predictions), r2_score(y_all, predictions))
+        key = model_key(name, models[name][0], models[name][1], training_hash)
+        with open(os.path.join(cache_dir, key + ".pkl"), "wb") as f:
+            pickle.dump({"model": fitted[name], "scores": results[name], "scoring_hash": scoring_hash}, f)
+
+    return {name: results[name] for name in models}, {name: fitted[name] for name in models}
@@ -0,0 +1,256 @@
+import argparse
+import ast
+import hashlib
+import importlib.util
+import inspect
+import json
+import os
+import shutil
+
+from instrumentation import configure, span, write_trace
+
+
+# stages are declared as name -> (function, {input name: path}, {output name: path}), in execution order;
+# a stage is re-run only if its code or the content of one of its inputs changed, or an output is missing
+STATE_FILE = "pipeline-state.json"
+# output of a stage with the results it reuses between runs (weather archives, fitted models), cleared when forced
+CACHE_OUTPUT = "cache"
+CHUNK_SIZE = 1 << 20
+# stage code = the stage function, the functions and constants of its module it refers to and every module of
+# the same folder those import, directly or not; the pipeline itself and the instrumentation do not change
+# outputs and are left out
+NOT_HASHED = {"pipeline", "instrumentation"}
+
+
+def file_hash(path, known=None):
+    # sha256 of the content, reused from known while size and mtime are unchanged (accidents.db is several GB)
+    stat = os.stat(path)
+    signature = [stat.st_size, stat.st_mtime_ns]
+    if known and known.get(path, {}).get("signature") == signature:
+        return known[path]["hash"]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    if known is not None:
+        known[path] = {"signature": signature, "hash": h.hexdigest()}
+    return h.hexdigest()
+
+
+def path_hash(path, known=None):
+    # files are hashed directly, directories (columnar store, weather archives) as their sorted file listing
+    if not os.path.exists(path):
+        return None
+    if os.path.isfile(path):
+        return file_hash(path, known)
+    h = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            h.update(os.path.relpath(file_path, path).encode())
+            h.update(file_hash(file_path, known).encode())
+    return h.hexdigest()
+
+
+def local_module_path(module_name, folder):
+    # source file of a module from folder, None for the standard library and installed packages
+    try:
+        spec = importlib.util.find_spec(module_name)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or not spec.origin or not spec.origin.endswith(".py"):
+        return None
+    path = os.path.abspath(spec.origin)
+    return path if os.path.dirname(path) == folder and module_name not in NOT_HASHED else None
+
+
+def imported_modules(node):
+    # names of the modules imported anywhere inside node
+    names = []
+    for x in ast.walk(node):
+        if isinstance(x, ast.Import):
+            names.extend(y.name for y in x.names)
+        elif isinstance(x, ast.ImportFrom) and x.module and not x.level:
+            names.append(x.module)
+    return names
+
+
+def code_dependencies(path):
+    # {module name: source path} of the module at path and of every local module it imports, including
+    # imports inside functions - constants like LAW_CHANGES or the SQL in queries.py count as code
+    folder = os.path.dirname(os.path.abspath(path))
+    modules, pending = {}, [(os.path.splitext(os.path.basename(path))[0], path)]
+    while pending:
+        module_name, module_path = pending.pop()
+        if module_name in modules:
+            continue
+        modules[module_name] = module_path
+        with open(module_path, encoding="utf-8") as f:
+            tree = ast.parse(f.read(), module_path)
+        for x in imported_modules(tree):
+            x_path = local_module_path(x, folder)
+            if x_path:
+                pending.append((x, x_path))
+    return modules
+
+
+def stage_code(func):
+    # ({top-level name: source} of the stage function and the functions / constants of its module it refers to,
+    # {module name: path} of the local modules they use) - an edited helper of one stage leaves the others cached
+    path = os.path.abspath(inspect.getsourcefile(func))
+    folder = os.path.dirname(path)
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    tree = ast.parse(source, path)
+
+    definitions, imports = {}, {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            definitions[node.name] = node
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            for target in node.targets if isinstance(node, ast.Assign) else [node.target]:
+                for x in ast.walk(target):
+                    if isinstance(x, ast.Name):
+                        definitions[x.id] = node
+        elif isinstance(node, ast.Import):
+            imports.update({(x.asname or x.name).split(".")[0]: x.name for x in node.names})
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            imports.update({x.asname or x.name: node.module for x in node.names})
+
+    if func.__name__ not in definitions:
+        # nested functions and lambdas - the whole module
+        return {}, code_dependencies(path)
+
+    sources, modules, pending = {}, {}, [func.__name__]
+    while pending:
+        name = pending.pop()
+        if name in sources:
+            continue
+        node = definitions[name]
+        sources[name] = ast.get_source_segment(source, node)
+        for x in ast.walk(node):
+            if isinstance(x, ast.Name) and x.id in definitions:
+                pending.append(x.id)
+        used = {imports[x.id] for x in ast.walk(node) if isinstance(x, ast.Name) and x.id in imports}
+        for module_name in sorted(used) + imported_modules(node):
+            module_path = local_module_path(module_name, folder)
+            if module_path:
+                modules.update(code_dependencies(module_path))
+    return sources, modules
+
+
+def stage_key(name, func, inputs, known):
+    # the stage code and the content of its inputs, so changed settings like FLAGS_IN_SQL, LAW_CHANGES windows
+    # or queries re-run the stages using them
+    sources, modules = stage_code(func)
+    h = hashlib.sha256(name.encode())
+    for source_name, text in sorted(sources.items()):
+        h.update(f"{source_name}={text}".encode())
+    for module_name, path in sorted(modules.items()):
+        h.update(module_name.encode())
+        h.update(file_hash(path, known).encode())
+    for input_name, path in sorted(inputs.items()):
+        h.update(f"{input_name}={path_hash(path, known)}".encode())
+    return h.hexdigest()
+
+
+def required_stages(stages, targets):
+    # targets plus every stage producing one of their inputs, in declaration order
+    producers = {path: name for name, (_, _, outputs) in stages.items() for path in outputs.values()}
+    required, pending = set(), list(targets)
+    while pending:
+        name = pending.pop()
+        if name in required:
+            continue
+        required.add(name)
+        pending.extend(producers[path] for path in stages[name][1].values() if path in producers)
+    return [name for name in stages if name in required]
+
+
+def load_state(state_path):
+    if not os.path.exists(state_path):
+        return {"stages": {}, "files": {}}
+    with open(state_path) as f:
+        return json.load(f)
+
+
+def save_state(state, state_path):
+    os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+    with open(state_path, "w") as f:
+        json.dump(state, f, indent=2)
+
+
+def run(stages, targets=None, state_path=STATE_FILE, force=()):
+    # runs the required stages, returns {stage: "ran" / "cached"}
+    state = load_state(state_path)
+    statuses = {}
+    for name in required_stages(stages, targets or list(stages)):
+        func, inputs, outputs = stages[name]
+        missing = [path for path in inputs.values() if not os.path.exists(path)]
+        if missing:
+            raise FileNotFoundError(f"stage {name}: missing inputs {missing}")
+
+        key = stage_key(name, func, inputs, state["files"])
+        cached = state["stages"].get(name) == key and all(os.path.exists(x) for x in outputs.values())
+        if cached and name not in force:
+            statuses[name] = "cached"
+            with span(name, status="cached"):
+                pass
+            continue
+
+        if name in force and CACHE_OUTPUT in outputs:
+            shutil.rmtree(outputs[CACHE_OUTPUT], ignore_errors=True)
+        for path in outputs.values():
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with span(name):
+            func(inputs, outputs)
+        state["stages"][name] = key
+        save_state(state, state_path)
+        statuses[name] = "ran"
+    return statuses
+
+
+def cli(stages, description=None, args=None):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("stages", nargs="*", help="stages to bring up to date (with their dependencies), default: all")
+    parser.add_argument("--force", nargs="*", default=None, help="re-run these stages (all if none given) even if cached, without their caches")
+    parser.add_argument("--list", action="store_true", help="list the stages with their inputs and outputs")
+    parser.add_argument("--state", default=STATE_FILE, help="file with the stage and input hashes of the last run")
+    parser.add_argument("--trace", help="write a JSON trace of the stages (time, rows, memory) to this file")
+    parser.add_argument("--tracemalloc", action="store_true", help="add tracemalloc deltas to the trace (slower)")
+    parser.add_argument("--profile", help="dump a cProfile .prof file per stage into this directory")
+    args = parser.parse_args(args)
+
+    if args.list:
+        for name, (_, inputs, outputs) in stages.items():
+            print(name)
+            print("    in: ", ", ".join(inputs.values()))
+            print("    out:", ", ".join(outputs.values()))
+        return
+
+    unknown = [x for x in args.stages + (args.force or []) if x not in stages]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+    force = list(stages) if args.force == [] else (args.force or [])
+    configure(args.tracemalloc, args.profile)
+    try:
+        for name, status in run(stages, args.stages or None, args.state, force).items():
+            print(f"{name}: {status}")
+    finally:
+        if args.trace:
+            write_trace(args.trace)
+
+
+def all_stages(db_path, input_path, output_path):
+    # both scripts chained: the model stages read pedestrians-accidents-by-days.csv written by the stats stages
+    from calculate_accidents_stats import stages as stats_stages
+    from train_traffic_weather_models import stages as model_stages
+    stats = stats_stages(db_path, output_path)
+    models = model_stages(input_path, output_path, accidents_path=os.path.join(output_path, "pedestrians-accidents-by-days.csv"))
+    return {**stats, **models}
+
+
+if __name__ == "__main__":
+    from queries import DB_PATH
+    cli(all_stages(DB_PATH, "input/path", "output/path"), "accidents stats and traffic / weather models")
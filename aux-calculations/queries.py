@@ -0,0 +1,210 @@
+DB_PATH = "database/path/accidents.db"
+
+
+# the 16 lookups of the main incident query - INNER JOINs, so they also filter incidents
+INCIDENT_JOINS = """
+    INNER JOIN aaa_types ON type_id = aaa_types.nid
+
+    INNER JOIN aaa_voivodeships ON voivodeship_id = aaa_voivodeships.nid
+    INNER JOIN aaa_districts ON district_id = aaa_districts.nids
+    INNER JOIN aaa_communes ON commune_id = aaa_communes.nid
+
+    INNER JOIN aaa_cond_light ON cond_light_id = aaa_cond_light.nid
+    INNER JOIN aaa_cond_weather ON cond_weather_id = aaa_cond_weather.nid
+
+    INNER JOIN aaa_place_markings ON place_markings_id = aaa_place_markings.nid
+    INNER JOIN aaa_place_terrains ON place_terrain_type_id = aaa_place_terrains.nid
+    INNER JOIN aaa_places ON place_id = aaa_places.nid
+    INNER JOIN aaa_places_cross_types ON place_cross_type_id = aaa_places_cross_types.nid
+    INNER JOIN aaa_places_geometries ON place_geometry_id = aaa_places_geometries.nid
+    INNER JOIN aaa_places_road_types ON place_road_type_id = aaa_places_road_types.nid
+    INNER JOIN aaa_places_roadlights ON place_roadlights_id = aaa_places_roadlights.nid
+    INNER JOIN aaa_places_speed_limits ON place_speed_limit_id = aaa_places_speed_limits.nid
+    INNER JOIN aaa_places_surface_conds ON place_surface_cond_id = aaa_places_surface_conds.nid
+    INNER JOIN aaa_places_surface_types ON place_surface_type_id = aaa_places_surface_types.nid
+"""
+
+# every lookup joined by the main incident query:
+# (id column in zzz_incidents, lookup table, key column, value column, output column or None)
+# lookups with no output column only act as INNER JOIN filters, same as in the SQL query
+INCIDENT_LOOKUPS = [
+    ("type_id", "aaa_types", "nid", "type", "type"),
+    ("voivodeship_id", "aaa_voivodeships", "nid", "voivodeship", "voivodeship"),
+    ("district_id", "aaa_districts", "nids", "region", "region"),
+    ("commune_id", "aaa_communes", "nid", "commune", "commune"),
+    ("cond_light_id", "aaa_cond_light", "nid", "light", "light"),
+    ("cond_weather_id", "aaa_cond_weather", "nid", "weather", "weather"),
+    ("place_markings_id", "aaa_place_markings", "nid", None, None),
+    ("place_terrain_type_id", "aaa_place_terrains", "nid", None, None),
+    ("place_id", "aaa_places", "nid", "place", "place"),
+    ("place_cross_type_id", "aaa_places_cross_types", "nid", None, None),
+    ("place_geometry_id", "aaa_places_geometries", "nid", None, None),
+    ("place_road_type_id", "aaa_places_road_types", "nid", None, None),
+    ("place_roadlights_id", "aaa_places_roadlights", "nid", None, None),
+    ("place_speed_limit_id", "aaa_places_speed_limits", "nid", None, None),
+    ("place_surface_cond_id", "aaa_places_surface_conds", "nid", "place_surface_cond", "place_surface_condition"),
+    ("place_surface_type_id", "aaa_places_surface_types", "nid", None, None),
+]
+
+PARTICIPANT_LOOKUPS = [
+    ("vehicle_type_id", "bbb_vehicle_types", "nid", "vehicle_type", "vehicle_type"),
+    ("vehicle_detail_id", "bbb_vehicle_details", "nid", "vehicle_detail", "vehicle_detail"),
+]
+
+PASSENGER_LOOKUPS = [
+    ("passenger_type_id", "ccc_passenger_types", "nid", "passenger_type", "passenger_type"),
+    ("rights_id", "ccc_rights", "nid", "rights", "rights"),
+    ("under_influence_id", "ccc_under_influences", "nid", "under_influence", "under_influence"),
+    ("injury_id", "ccc_injuries", "nid", "injury", "injury"),
+    ("penalty_id", "ccc_penalties", "nid", "penalty", "penalty"),
+    ("fault_id", "ccc_faults", "nid", "fault", "fault"),
+]
+
+# get all accidents, no vehicle details, no passenger details
+INCIDENTS_SQL = f"""
+    SELECT zzz_incidents.incident_id, aaa_types.type,
+    aaa_voivodeships.voivodeship, aaa_districts.region, aaa_communes.commune, lat, lng,
+    unix_timestamp, date, time, period, year, month,
+    light, weather,
+    aaa_places.place, aaa_places_surface_conds.place_surface_cond
+    FROM zzz_incidents
+    {INCIDENT_JOINS}
+    WHERE type_id IS NOT NULL;
+"""
+INCIDENTS_DTYPES = {
+    "incident_id": "int64", "type": "category",
+    "voivodeship": "category", "region": "category", "commune": "category", "lat": "float64", "lng": "float64",
+    "unix_timestamp": "Int64", "date": "object", "time": "object", "period": "object", "year": "int64", "month": "int64",
+    "light": "category", "weather": "category",
+    "place": "category", "place_surface_condition": "category",
+}
+
+# per-incident flags, one GROUP BY incident_id per child table
+FLAG_CTES = """
+    WITH vehicle_flags AS (
+        SELECT zzz_participants.incident_id,
+        MAX(CASE WHEN bbb_vehicle_types.vehicle_type = 'Rower' THEN 1 ELSE 0 END) AS involved_bicycle,
+        MAX(CASE WHEN bbb_vehicle_types.vehicle_type = 'Pieszy' THEN 1 ELSE 0 END) AS involved_pedestrian
+        FROM zzz_participants
+        LEFT JOIN bbb_vehicle_types ON zzz_participants.vehicle_type_id = bbb_vehicle_types.nid
+        {participants_where}
+        GROUP BY zzz_participants.incident_id
+    ),
+    passenger_flags AS (
+        SELECT zzz_passengers.incident_id,
+        MAX(CASE WHEN bbb_vehicle_types.vehicle_type = 'Pieszy' THEN zzz_passengers.born_year END) AS pedestrian_born_year,
+        MAX(CASE WHEN ccc_injuries.injury = 'Ranny lekko' THEN 1 ELSE 0 END) AS injury_minor,
+        MAX(CASE WHEN ccc_injuries.injury = 'Ranny ciężko' THEN 1 ELSE 0 END) AS injury_major,
+        MAX(CASE WHEN ccc_injuries.injury = 'Śmierć w ciągu 30 dni' THEN 1 ELSE 0 END) AS injury_death_30days,
+        MAX(CASE WHEN ccc_injuries.injury = 'Smierć na miejscu' THEN 1 ELSE 0 END) AS injury_death_instant,
+        MAX(CASE WHEN ccc_under_influences.under_influence = 'Alkoholu' AND ccc_passenger_types.passenger_type = 'Kierujący' THEN 1 ELSE 0 END) AS intoxicated_alcohol,
+        MAX(CASE WHEN ccc_under_influences.under_influence = 'Innego środka' AND ccc_passenger_types.passenger_type = 'Kierujący' THEN 1 ELSE 0 END) AS intoxicated_drugs
+        FROM zzz_passengers
+        LEFT JOIN zzz_participants ON zzz_passengers.vehicle_id = zzz_participants.nid
+        LEFT JOIN bbb_vehicle_types ON zzz_participants.vehicle_type_id = bbb_vehicle_types.nid
+        LEFT JOIN ccc_passenger_types ON zzz_passengers.passenger_type_id = ccc_passenger_types.nid
+        LEFT JOIN ccc_under_influences ON zzz_passengers.under_influence_id = ccc_under_influences.nid
+        LEFT JOIN ccc_injuries ON zzz_passengers.injury_id = ccc_injuries.nid
+        {passengers_where}
+        GROUP BY zzz_passengers.incident_id
+    )
+"""
+
+
+def flag_ctes(incident_filter=None):
+    # incident_filter - SQL condition on zzz_incidents restricting the incidents whose children are aggregated
+    if incident_filter is None:
+        return FLAG_CTES.format(participants_where="", passengers_where="")
+    return FLAG_CTES.format(
+        participants_where=f"WHERE zzz_participants.incident_id IN (SELECT incident_id FROM zzz_incidents WHERE {incident_filter})",
+        passengers_where=f"WHERE zzz_passengers.incident_id IN (SELECT incident_id FROM zzz_incidents WHERE {incident_filter})",
+    )
+
+
+FLAGS_SQL = flag_ctes() + """
+    SELECT zzz_incidents.incident_id,
+    COALESCE(vehicle_flags.involved_bicycle, 0), COALESCE(vehicle_flags.involved_pedestrian, 0),
+    passenger_flags.pedestrian_born_year,
+    COALESCE(passenger_flags.injury_minor, 0), COALESCE(passenger_flags.injury_major, 0),
+    COALESCE(passenger_flags.injury_death_30days, 0), COALESCE(passenger_flags.injury_death_instant, 0),
+    COALESCE(passenger_flags.intoxicated_alcohol, 0), COALESCE(passenger_flags.intoxicated_drugs, 0)
+    FROM zzz_incidents
+    LEFT JOIN vehicle_flags ON zzz_incidents.incident_id = vehicle_flags.incident_id
+    LEFT JOIN passenger_flags ON zzz_incidents.incident_id = passenger_flags.incident_id
+    WHERE zzz_incidents.type_id IS NOT NULL;
+"""
+FLAGS_DTYPES = {
+    "incident_id": "int64", "involved_bicycle": "bool", "involved_pedestrian": "bool",
+    "pedestrian_born_year": "float64",
+    "injury_minor": "bool", "injury_major": "bool", "injury_death_30days": "bool", "injury_death_instant": "bool",
+    "intoxicated_alcohol": "bool", "intoxicated_drugs": "bool",
+}
+
+# get all participants
+PARTICIPANTS_SQL = """
+    SELECT zzz_participants.nid, zzz_participants.incident_id, bbb_vehicle_types.vehicle_type, bbb_vehicle_details.vehicle_detail
+    FROM zzz_participants
+    LEFT JOIN bbb_vehicle_types ON zzz_participants.vehicle_type_id = bbb_vehicle_types.nid
+    LEFT JOIN bbb_vehicle_details ON zzz_participants.vehicle_detail_id = bbb_vehicle_details.nid
+    LEFT JOIN bbb_vehicle_models ON zzz_participants.vehicle_model_id = bbb_vehicle_models.nid
+"""
+PARTICIPANTS_DTYPES = {
+    "vehicle_id": "int64", "incident_id": "int64", "vehicle_type": "category", "vehicle_detail": "category"
+}
+
+# get all passengers
+PASSENGERS_SQL = """
+    SELECT zzz_passengers.incident_id, zzz_passengers.vehicle_id,
+    ccc_passenger_types.passenger_type, zzz_passengers.born, zzz_passengers.born_year, zzz_passengers.gender,
+    ccc_rights.rights, zzz_passengers.driving_experience, ccc_under_influences.under_influence,
+    ccc_injuries.injury, ccc_penalties.penalty, ccc_faults.fault
+    FROM zzz_passengers
+    LEFT JOIN ccc_passenger_types ON zzz_passengers.passenger_type_id = ccc_passenger_types.nid
+    LEFT JOIN ccc_rights ON zzz_passengers.rights_id = ccc_rights.nid
+    LEFT JOIN ccc_under_influences ON zzz_passengers.under_influence_id = ccc_under_influences.nid
+    LEFT JOIN ccc_injuries ON zzz_passengers.injury_id = ccc_injuries.nid
+    LEFT JOIN ccc_penalties ON zzz_passengers.penalty_id = ccc_penalties.nid
+    LEFT JOIN ccc_faults ON zzz_passengers.fault_id = ccc_faults.nid
+"""
+PASSENGERS_DTYPES = {
+    "incident_id": "int64", "vehicle_id": "int64",
+    "passenger_type": "category", "born": "object", "born_year": "float64", "gender": "category",
+    "rights": "category", "driving_experience": "object", "under_influence": "category", "injury": "category", "penalty": "category", "fault": "category",
+}
+
+# daily counts per voivodeship behind data/*-accidents-by-days.csv and the monthly slice,
+# computed in SQLite for the incidents matching incident_filter
+DAILY_COUNTS_SQL = """
+    SELECT zzz_incidents.year, zzz_incidents.date, aaa_voivodeships.voivodeship,
+    COUNT(*),
+    SUM(COALESCE(vehicle_flags.involved_bicycle, 0)),
+    SUM(CASE WHEN aaa_places.place = 'Przejście dla pieszych' THEN COALESCE(vehicle_flags.involved_pedestrian, 0) ELSE 0 END),
+    SUM(COALESCE(passenger_flags.intoxicated_alcohol, 0))
+    FROM zzz_incidents
+    {incident_joins}
+    LEFT JOIN vehicle_flags ON zzz_incidents.incident_id = vehicle_flags.incident_id
+    LEFT JOIN passenger_flags ON zzz_incidents.incident_id = passenger_flags.incident_id
+    WHERE type_id IS NOT NULL AND {incident_filter}
+    GROUP BY zzz_incidents.year, zzz_incidents.date, aaa_voivodeships.voivodeship;
+"""
+
+
+def daily_counts_sql(incident_filter=None):
+    return flag_ctes(incident_filter) + DAILY_COUNTS_SQL.format(incident_joins=INCIDENT_JOINS, incident_filter=incident_filter or "1")
+
+
+DAILY_COUNTS_DTYPES = {
+    "year": "int64", "date": "object", "voivodeship": "object",
+    "total": "int64", "bicycle": "int64", "pedestrians": "int64", "alcohol": "int64",
+}
+
+# fingerprint of every month - changes when incidents are added, removed or renumbered
+MONTH_FINGERPRINTS_SQL = """
+    SELECT substr(date, 1, 7), COUNT(*), SUM(incident_id), MAX(incident_id)
+    FROM zzz_incidents
+    WHERE type_id IS NOT NULL
+    GROUP BY substr(date, 1, 7);
+"""
+MONTH_FINGERPRINTS_DTYPES = {
+    "month": "object", "count": "int64", "sum_incident_id": "int64", "max_incident_id": "int64",
+}
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+
+BATCH_SIZE = 100_000
+
+
+def _column(values, dtype):
+    # one typed column buffer from a batch of raw sqlite values
+    if dtype == "category":
+        return pd.Categorical(values)
+    if dtype == "object":
+        column = np.empty(len(values), dtype=object)
+        column[:] = values
+        return column
+    if dtype in ("Int8", "Int16", "Int32", "Int64", "Float64", "boolean", "string"):
+        return pd.array(values, dtype=dtype)
+    # numpy dtypes - use float64 for numeric columns that may contain NULL
+    return np.array(values, dtype=dtype)
+
+
+def _concat(parts, dtype):
+    if dtype == "category":
+        return union_categoricals(parts)
+    if isinstance(parts[0], np.ndarray):
+        return np.concatenate(parts)
+    return pd.concat([pd.Series(x) for x in parts], ignore_index=True).array
+
+
+def _batch_columns(rows, dtypes):
+    columns = list(zip(*rows))
+    return {name: _column(values, dtype) for (name, dtype), values in zip(dtypes.items(), columns)}
+
+
+def _empty_frame(dtypes):
+    return pd.DataFrame({name: pd.Series([], dtype=dtype) for name, dtype in dtypes.items()})
+
+
+def iter_query(conn, sqlstr, dtypes, batch_size=BATCH_SIZE, params=()):
+    # generator mode - one typed DataFrame per batch, for aggregations that run chunk by chunk in constant memory
+    # dtypes: {column name: dtype} in the order of the SELECT
+    c = conn.cursor()
+    c.execute(sqlstr, params)
+    try:
+        while True:
+            rows = c.fetchmany(batch_size)
+            if not rows:
+                break
+            yield pd.DataFrame(_batch_columns(rows, dtypes))
+    finally:
+        c.close()
+
+
+def read_query(conn, sqlstr, dtypes, batch_size=BATCH_SIZE, params=()):
+    # streams the cursor in fixed-size batches straight into typed column buffers,
+    # so only one batch of python tuples is alive at a time
+    c = conn.cursor()
+    c.execute(sqlstr, params)
+    buffers = {name: [] for name in dtypes}
+    while True:
+        rows = c.fetchmany(batch_size)
+        if not rows:
+            break
+        for name, column in _batch_columns(rows, dtypes).items():
+            buffers[name].append(column)
+        del rows
+    c.close()
+
+    if not buffers or not next(iter(buffers.values())):
+        return _empty_frame(dtypes)
+    return pd.DataFrame({name: _concat(buffers.pop(name), dtype) for name, dtype in dtypes.items()})
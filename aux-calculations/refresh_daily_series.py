@@ -0,0 +1,175 @@
+import gzip
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from query_loader import read_query
+from db_setup import connect
+from queries import DB_PATH, DAILY_COUNTS_DTYPES, MONTH_FINGERPRINTS_SQL, MONTH_FINGERPRINTS_DTYPES, daily_counts_sql
+from daily_series import write_daily_series
+from build_cube import UNKNOWN, rolling_avg, write_json_gz
+
+
+OUTPUT_PATH = "output/path"
+STATE_FILE = "daily-series-state.json"
+
+MONTHLY_SLICE_FILE = "accidents-by-months.json.gz"
+
+# output file -> column of the daily counts query, in the order of DAILY_SERIES in calculate_accidents_stats.py
+# (the order of the arrays in the binary)
+OUTPUTS = {
+    "total-accidents-by-days.csv": "total",
+    "bicycle-accidents-by-days.csv": "bicycle",
+    "alcohol-accidents-by-days.csv": "alcohol",
+    "pedestrians-accidents-by-days.csv": "pedestrians",
+}
+
+
+def load_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state, path):
+    with open(path, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+
+
+def month_fingerprints(conn):
+    # month -> [number of incidents, sum of incident ids], plus the highest incident id (high-water mark)
+    df = read_query(conn, MONTH_FINGERPRINTS_SQL, MONTH_FINGERPRINTS_DTYPES)
+    df = df[df["month"].notna()]
+    fingerprints = {month: [int(count), int(sum_id)] for month, count, sum_id, _ in df.itertuples(index=False)}
+    return fingerprints, int(df["max_incident_id"].max()) if len(df) else -1
+
+
+def dirty_months(fingerprints, output_state):
+    # months that are new, gained or lost incidents, or whose incident ids changed since the output was written
+    stored = output_state.get("months", {})
+    return sorted(m for m in set(fingerprints) | set(stored) if fingerprints.get(m) != stored.get(m))
+
+
+def months_filter(months):
+    for month in months:
+        if not re.fullmatch(r"\d{4}-\d{2}", month):
+            raise ValueError(f"unexpected month in zzz_incidents.date: {month!r}")
+    return "substr(zzz_incidents.date, 1, 7) IN ({})".format(", ".join(f"'{m}'" for m in months))
+
+
+def merge_daily_counts(df_existing, df_new, months):
+    # replace the refreshed months, only days with accidents are kept - write_daily_series zero-fills the rest
+    df_existing = df_existing[~df_existing["date"].str[:7].isin(months) & (df_existing["count"] > 0)]
+    df = pd.concat([df_existing, df_new[df_new["count"] > 0]], ignore_index=True)
+    return df.sort_values("date").reset_index(drop=True)
+
+
+def daily_arrays(merged):
+    # {output: daily counts} -> (first day, {series: counts per day}) over the day range of all accidents,
+    # same as daily_series.daily_counts in the full rebuild
+    days = {output: df["date"].to_numpy(dtype="datetime64[D]") for output, df in merged.items()}
+    first_day = min(x.min() for x in days.values() if len(x))
+    n_days = int((max(x.max() for x in days.values() if len(x)) - first_day).astype(np.int64)) + 1
+    return first_day, {
+        output.replace("-by-days.csv", ""): np.bincount((days[output] - first_day).astype(np.int64), weights=df["count"].to_numpy(), minlength=n_days).astype(np.uint32)
+        for output, df in merged.items()
+    }
+
+
+def merge_monthly_slice(monthly, df_daily, months):
+    # replace the refreshed months of the monthly slice written by build_cube.export_cube, same layout as
+    # build_cube.monthly_slice: periods from the first to the last month with accidents, labels with accidents only
+    parts = []
+    for name, by_voivodeship in monthly["by_voivodeship"].items():
+        for label, values in by_voivodeship.items():
+            df_x = pd.DataFrame({"series": name, "voivodeship": label, "month": monthly["periods"], "count": values})
+            parts.append(df_x[~df_x["month"].isin(months)])
+
+    df_new = df_daily[df_daily["date"].str[:7].isin(months)].assign(
+        month=lambda x: x["date"].str[:7],
+        voivodeship=lambda x: x["voivodeship"].fillna(UNKNOWN),
+    )
+    for output, column in OUTPUTS.items():
+        df_x = df_new.groupby(["voivodeship", "month"])[column].sum().reset_index(name="count")
+        parts.append(df_x.assign(series=output.replace("-by-days.csv", "")))
+    df = pd.concat(parts, ignore_index=True)
+    df = df[df["count"] > 0]
+
+    months_with_accidents = df["month"].to_numpy(dtype="datetime64[M]")
+    periods = [str(x) for x in np.arange(months_with_accidents.min(), months_with_accidents.max() + 1)]
+    result = {"periods": periods, "series": {}, "by_voivodeship": {}}
+    for output in OUTPUTS:
+        name = output.replace("-by-days.csv", "")
+        df_x = df[df["series"] == name].groupby(["voivodeship", "month"])["count"].sum().unstack(fill_value=0)
+        df_x = df_x.reindex(columns=periods, fill_value=0)
+        total = df_x.sum(axis=0).astype(int).to_numpy() if len(df_x) else np.zeros(len(periods), dtype=int)
+        result["series"][name] = {"count": total.tolist(), "rolling_avg": rolling_avg(total)}
+        # sorted labels, UNKNOWN last - the category order of build_cube._codes
+        labels = sorted(x for x in df_x.index if x != UNKNOWN) + [x for x in df_x.index if x == UNKNOWN]
+        result["by_voivodeship"][name] = {label: df_x.loc[label].astype(int).tolist() for label in labels}
+    return result
+
+
+def read_monthly_slice(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def refresh(db_path=DB_PATH, output_path=OUTPUT_PATH):
+    state_path = os.path.join(output_path, STATE_FILE)
+    state = load_state(state_path)
+
+    conn = connect(db_path)
+    fingerprints, max_incident_id = month_fingerprints(conn)
+
+    # the monthly slice of the full rebuild has no state yet, so all of its months are refreshed the first time
+    monthly_path = os.path.join(output_path, MONTHLY_SLICE_FILE)
+    months_by_output = {}
+    for output in list(OUTPUTS) + ([MONTHLY_SLICE_FILE] if os.path.exists(monthly_path) else []):
+        output_state = state.get(output, {}) if os.path.exists(os.path.join(output_path, output)) else {}
+        months_by_output[output] = dirty_months(fingerprints, output_state)
+    months = sorted(set().union(*months_by_output.values()))
+
+    if not months:
+        conn.close()
+        return months_by_output
+
+    # one aggregation in SQLite over the dirty months only, shared by all outputs
+    incident_filter = None if set(months) >= set(fingerprints) else months_filter([m for m in months if m in fingerprints])
+    df_daily = read_query(conn, daily_counts_sql(incident_filter), DAILY_COUNTS_DTYPES)
+    conn.close()
+
+    # every series is merged over all refreshed months, the binary and the monthly slice hold all of them
+    merged = {}
+    for output, column in OUTPUTS.items():
+        path = os.path.join(output_path, output)
+        if os.path.exists(path) and output in state:
+            df_existing = pd.read_csv(path, dtype={"year": "int64", "date": "str", "count": "int64"})
+        else:
+            df_existing = pd.DataFrame({"year": pd.Series([], dtype="int64"), "date": pd.Series([], dtype="str"), "count": pd.Series([], dtype="int64")})
+        df_new = df_daily[df_daily["date"].str[:7].isin(months)].groupby(["year", "date"])[column].sum().reset_index(name="count")
+        merged[output] = merge_daily_counts(df_existing, df_new, months)
+
+    # zero-filled csv files and the binary of the day charts, same writer as the full rebuild
+    first_day, counts = daily_arrays(merged)
+    write_daily_series(first_day, counts, output_path)
+
+    # the monthly slice is merged when the full rebuild wrote one; the yearly slice and the cube
+    # (type breakdowns) still need the export stage of calculate_accidents_stats.py
+    if MONTHLY_SLICE_FILE in months_by_output:
+        write_json_gz(merge_monthly_slice(read_monthly_slice(monthly_path), df_daily, months), monthly_path)
+
+    for output in months_by_output:
+        state[output] = {"max_incident_id": max_incident_id, "months": fingerprints}
+
+    save_state(state, state_path)
+    return months_by_output
+
+
+if __name__ == "__main__":
+    for output, months in refresh().items():
+        print(f"{output}: {len(months)} months refreshed")
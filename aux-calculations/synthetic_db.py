@@ -0,0 +1,309 @@
+import argparse
+import csv
+import datetime
+import os
+import sqlite3
+
+import numpy as np
+
+from db_setup import setup_database
+
+
+# synthetic accidents.db with the SEWIK schema, for reproducible benchmarks
+SCALES = {"100k": 100_000, "1M": 1_000_000, "7M": 7_000_000}
+CHUNK_SIZE = 200_000
+# real daily totals and type counts - dates and types are sampled from them when present
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+FIRST_DAY, LAST_DAY = datetime.date(2007, 1, 1), datetime.date(2022, 12, 31)
+
+VOIVODESHIPS = {
+    "MAZOWIECKIE": 0.13, "ŚLĄSKIE": 0.11, "WIELKOPOLSKIE": 0.09, "MAŁOPOLSKIE": 0.09, "DOLNOŚLĄSKIE": 0.08,
+    "ŁÓDZKIE": 0.07, "POMORSKIE": 0.06, "KUJAWSKO-POMORSKIE": 0.05, "LUBELSKIE": 0.05, "ZACHODNIOPOMORSKIE": 0.05,
+    "PODKARPACKIE": 0.04, "WARMIŃSKO-MAZURSKIE": 0.04, "ŚWIĘTOKRZYSKIE": 0.03, "PODLASKIE": 0.03, "LUBUSKIE": 0.03,
+    "OPOLSKIE": 0.03,
+}
+N_DISTRICTS, N_COMMUNES, N_VEHICLE_MODELS = 380, 2480, 600
+
+# lookup table -> (key column, value column, {value: weight}), weights are used where the column is drawn at random
+LOOKUPS = {
+    "aaa_types": ("nid", "type", {}),
+    "aaa_voivodeships": ("nid", "voivodeship", VOIVODESHIPS),
+    "aaa_cond_light": ("nid", "light", {"Światło dzienne": 0.7, "Zmierzch, świt": 0.07, "Noc - droga oświetlona": 0.15, "Noc - droga nieoświetlona": 0.08}),
+    "aaa_cond_weather": ("nid", "weather", {"Dobre warunki atmosferyczne": 0.72, "Pochmurno": 0.14, "Opady deszczu": 0.09, "Opady śniegu": 0.03, "Mgła, dym": 0.01, "Oślepiające słońce": 0.005, "Silny wiatr": 0.005}),
+    "aaa_place_markings": ("nid", "place_marking", {"Oznakowane": 0.8, "Nieoznakowane": 0.2}),
+    "aaa_place_terrains": ("nid", "place_terrain", {"Obszar zabudowany": 0.7, "Obszar niezabudowany": 0.3}),
+    "aaa_places": ("nid", "place", {"Jezdnia": 0.62, "Skrzyżowanie": 0.2, "Parking, plac, miejsce obsługi podróżnych": 0.1, "Pobocze": 0.04, "Chodnik, droga dla pieszych": 0.01, "Droga dla rowerów": 0.01, "Torowisko": 0.01, "Przejście dla pieszych": 0.01}),
+    "aaa_places_cross_types": ("nid", "place_cross_type", {"Brak": 0.75, "Skrzyżowanie równorzędne": 0.08, "Skrzyżowanie z drogą podporządkowaną": 0.12, "Rondo": 0.05}),
+    "aaa_places_geometries": ("nid", "place_geometry", {"Odcinek prosty": 0.8, "Zakręt, łuk": 0.15, "Wierzchołek wzniesienia": 0.03, "Spadek": 0.02}),
+    "aaa_places_road_types": ("nid", "place_road_type", {"Jedna jezdnia dwukierunkowa": 0.75, "Jednokierunkowa": 0.1, "Dwie jezdnie jednokierunkowe": 0.13, "Autostrada": 0.02}),
+    "aaa_places_roadlights": ("nid", "place_roadlight", {"Brak sygnalizacji": 0.85, "Sygnalizacja działa": 0.14, "Sygnalizacja nie działa": 0.01}),
+    "aaa_places_speed_limits": ("nid", "place_speed_limit", {"50": 0.6, "40": 0.05, "60": 0.05, "70": 0.05, "90": 0.15, "100": 0.03, "120": 0.03, "140": 0.04}),
+    "aaa_places_surface_conds": ("nid", "place_surface_cond", {"Sucha": 0.75, "Mokra": 0.18, "Błoto": 0.01, "Oblodzona": 0.03, "Zaśnieżona": 0.03}),
+    "aaa_places_surface_types": ("nid", "place_surface_type", {"Bitumiczna": 0.9, "Kostka": 0.06, "Gruntowa": 0.03, "Betonowa": 0.01}),
+    "bbb_vehicle_types": ("nid", "vehicle_type", {"Samochód osobowy": 0.78, "Samochód ciężarowy": 0.12, "Autobus": 0.02, "Motocykl": 0.02, "Motorower": 0.01, "Ciągnik rolniczy": 0.005, "Tramwaj": 0.005, "Inny": 0.02, "Rower": 0.02, "Pieszy": 0.0}),
+    "bbb_vehicle_details": ("nid", "vehicle_detail", {"Brak": 0.975, "Pojazd uprzywilejowany Policja": 0.004, "Pojazd uprzywilejowany Straż Pożarna": 0.001, "Pojazd uprzywilejowany Pogotowie Ratunkowe": 0.002, "Nauka jazdy": 0.003, "Pojazd komunikacji publicznej": 0.015}),
+    "bbb_vehicle_models": ("nid", "vehicle_model", {}),
+    "ccc_passenger_types": ("nid", "passenger_type", {"Kierujący": 0.0, "Pasażer": 0.0, "Pieszy": 0.0}),
+    "ccc_rights": ("nid", "rights", {"Kategoria B": 0.8, "Kategoria C": 0.1, "Kategoria A": 0.04, "Kategoria D": 0.02, "Brak uprawnień": 0.04}),
+    "ccc_under_influences": ("nid", "under_influence", {"Nie": 0.975, "Alkoholu": 0.02, "Innego środka": 0.005}),
+    "ccc_injuries": ("nid", "injury", {"Bez obrażeń": 0.94, "Ranny lekko": 0.035, "Ranny ciężko": 0.017, "Śmierć w ciągu 30 dni": 0.003, "Smierć na miejscu": 0.005}),
+    "ccc_penalties": ("nid", "penalty", {"Pouczenie": 0.06, "Mandat karny": 0.69, "Wniosek o ukaranie": 0.13, "Dochodzenie": 0.08, "Inny organ": 0.01, "Inny sposób zakończenia": 0.03}),
+    "ccc_faults": ("nid", "fault", {"Nieustąpienie pierwszeństwa przejazdu": 0.3, "Niedostosowanie prędkości do warunków ruchu": 0.2, "Nieprzestrzeganie odległości między pojazdami": 0.2, "Nieprawidłowe cofanie": 0.1, "Nieprawidłowe wyprzedzanie": 0.08, "Nieprawidłowa zmiana pasa ruchu": 0.07, "Nieudzielenie pierwszeństwa pieszemu": 0.05}),
+}
+
+# zzz_incidents id column -> lookup table, in the order of the real table
+INCIDENT_COLUMNS = {
+    "type_id": "aaa_types",
+    "voivodeship_id": "aaa_voivodeships",
+    "district_id": "aaa_districts",
+    "commune_id": "aaa_communes",
+    "cond_light_id": "aaa_cond_light",
+    "cond_weather_id": "aaa_cond_weather",
+    "place_markings_id": "aaa_place_markings",
+    "place_terrain_type_id": "aaa_place_terrains",
+    "place_id": "aaa_places",
+    "place_cross_type_id": "aaa_places_cross_types",
+    "place_geometry_id": "aaa_places_geometries",
+    "place_road_type_id": "aaa_places_road_types",
+    "place_roadlights_id": "aaa_places_roadlights",
+    "place_speed_limit_id": "aaa_places_speed_limits",
+    "place_surface_cond_id": "aaa_places_surface_conds",
+    "place_surface_type_id": "aaa_places_surface_types",
+}
+
+SCHEMA = [
+    """CREATE TABLE zzz_incidents (
+        incident_id INTEGER PRIMARY KEY,
+        {incident_columns},
+        lat REAL, lng REAL, unix_timestamp INTEGER, date TEXT, time TEXT, period TEXT, year INTEGER, month INTEGER
+    )""".format(incident_columns=",\n        ".join(f"{x} INTEGER" for x in INCIDENT_COLUMNS)),
+    """CREATE TABLE zzz_participants (
+        nid INTEGER PRIMARY KEY, incident_id INTEGER, vehicle_type_id INTEGER, vehicle_detail_id INTEGER, vehicle_model_id INTEGER
+    )""",
+    """CREATE TABLE zzz_passengers (
+        nid INTEGER PRIMARY KEY, incident_id INTEGER, vehicle_id INTEGER, passenger_type_id INTEGER,
+        born TEXT, born_year INTEGER, gender TEXT, rights_id INTEGER, driving_experience TEXT,
+        under_influence_id INTEGER, injury_id INTEGER, penalty_id INTEGER, fault_id INTEGER
+    )""",
+    # the district / commune hierarchy only lives in dimensions(), the real lookups have no parent columns
+    # (INCIDENT_JOINS refers to voivodeship_id and district_id unqualified)
+    "CREATE TABLE aaa_districts (nids INTEGER PRIMARY KEY, region TEXT)",
+    "CREATE TABLE aaa_communes (nid INTEGER PRIMARY KEY, commune TEXT)",
+] + [f"CREATE TABLE {table} ({key} INTEGER PRIMARY KEY, {value} TEXT)" for table, (key, value, _) in LOOKUPS.items()]
+
+
+def read_counts(file_name, key, value="count"):
+    path = os.path.join(DATA_PATH, file_name)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return {row[key]: int(row[value]) for row in csv.DictReader(f)}
+
+
+def probabilities(weights):
+    weights = np.asarray(list(weights), dtype=np.float64)
+    return weights / weights.sum()
+
+
+def dimensions(rng):
+    # lookup values and sampling weights shared by every chunk
+    n_days = (LAST_DAY - FIRST_DAY).days + 1
+    days = read_counts("total-accidents-by-days.csv", "date")
+    if days:
+        day_weights = np.zeros(n_days)
+        for date, count in days.items():
+            day_weights[(datetime.date.fromisoformat(date) - FIRST_DAY).days] = count
+    else:
+        # seasonal pattern with a slow decline, roughly like the real series
+        t = np.arange(n_days)
+        day_weights = (1 + 0.15 * np.sin(2 * np.pi * (t - 100) / 365.25)) * np.linspace(1.3, 0.7, n_days)
+
+    types = read_counts("accidents-by-types.csv", "type") or {"Zderzenie pojazdów boczne": 0.5, "Zderzenie pojazdów tylne": 0.3, "Najechanie na pieszego": 0.05, "Inne": 0.15}
+    values = {table: list(x[2]) for table, x in LOOKUPS.items()}
+    values["aaa_types"] = list(types)
+    values["bbb_vehicle_models"] = [f"Model {i}" for i in range(1, N_VEHICLE_MODELS + 1)]
+
+    # districts belong to voivodeships, communes to districts, every commune has its own centroid
+    district_voivodeship = rng.choice(len(VOIVODESHIPS), N_DISTRICTS, p=probabilities(VOIVODESHIPS.values()))
+    commune_district = np.sort(rng.integers(0, N_DISTRICTS, N_COMMUNES))
+    return {
+        "day_p": day_weights / day_weights.sum(),
+        "type_p": probabilities(types.values()),
+        "values": values,
+        "district_voivodeship": district_voivodeship,
+        "commune_district": commune_district,
+        "commune_p": probabilities(rng.pareto(1.5, N_COMMUNES) + 1),
+        "commune_lat": rng.uniform(49.3, 54.6, N_COMMUNES),
+        "commune_lng": rng.uniform(14.5, 23.8, N_COMMUNES),
+        "model_p": probabilities(rng.pareto(1.2, N_VEHICLE_MODELS) + 1),
+    }
+
+
+def pick(rng, table, n):
+    # 1-based lookup ids drawn with the weights of LOOKUPS
+    return rng.choice(len(LOOKUPS[table][2]), n, p=probabilities(LOOKUPS[table][2].values())) + 1
+
+
+def lookup_id(dims, table, value):
+    return dims["values"][table].index(value) + 1
+
+
+def incidents_chunk(rng, dims, first_id, n):
+    values = dims["values"]
+    type_ids = rng.choice(len(values["aaa_types"]), n, p=dims["type_p"]) + 1
+    type_names = np.array(values["aaa_types"], dtype=object)[type_ids - 1]
+    is_pedestrian = type_names == "Najechanie na pieszego"
+    # a few incidents have no type, the queries drop them
+    type_ids = np.where(rng.random(n) < 0.005, -1, type_ids)
+
+    commune = rng.choice(N_COMMUNES, n, p=dims["commune_p"])
+    district = dims["commune_district"][commune]
+    day = rng.choice(len(dims["day_p"]), n, p=dims["day_p"])
+    minute = np.clip(rng.normal(14.5 * 60, 4.5 * 60, n), 0, 24 * 60 - 1).astype(np.int64)
+    dates = np.datetime64(FIRST_DAY.isoformat(), "D") + day
+    timestamps = dates.astype("datetime64[s]").astype(np.int64) + minute * 60
+    years = dates.astype("datetime64[Y]").astype(np.int64) + 1970
+    months = dates.astype("datetime64[M]").astype(np.int64) % 12 + 1
+
+    # pedestrian crossings are common for pedestrian accidents, rare otherwise
+    place = pick(rng, "aaa_places", n)
+    crossing = rng.random(n) < np.where(is_pedestrian, 0.36, 0.002)
+    place = np.where(crossing, lookup_id(dims, "aaa_places", "Przejście dla pieszych"), place)
+
+    columns = {
+        "type_id": type_ids,
+        "voivodeship_id": dims["district_voivodeship"][district] + 1,
+        "district_id": district + 1,
+        "commune_id": commune + 1,
+        "place_id": place,
+    }
+    for column, table in INCIDENT_COLUMNS.items():
+        if column not in columns:
+            columns[column] = pick(rng, table, n)
+
+    rows = zip(
+        range(first_id, first_id + n),
+        *[np.where(columns[x] < 0, None, columns[x]).tolist() if x == "type_id" else columns[x].tolist() for x in INCIDENT_COLUMNS],
+        np.round(dims["commune_lat"][commune] + rng.normal(0, 0.05, n), 6).tolist(),
+        np.round(dims["commune_lng"][commune] + rng.normal(0, 0.08, n), 6).tolist(),
+        timestamps.tolist(),
+        dates.astype(str).tolist(),
+        [f"{x // 60:02d}:{x % 60:02d}" for x in minute.tolist()],
+        np.where(minute < 6 * 60, "Noc", np.where(minute < 18 * 60, "Dzień", "Wieczór")).tolist(),
+        years.tolist(),
+        months.tolist(),
+    )
+    return list(rows), type_names, is_pedestrian, years
+
+
+def vehicles_chunk(rng, dims, first_id, first_vehicle_id, type_names, is_pedestrian):
+    # collisions have 2-3 vehicles, other accidents one, pedestrian accidents one vehicle and the pedestrian
+    n = len(type_names)
+    collision = np.array([x.startswith("Zderzenie") for x in type_names])
+    n_vehicles = np.where(collision, 2 + (rng.random(n) < 0.08), 1)
+    incident = np.repeat(np.arange(n), n_vehicles)
+    vehicle_type = pick(rng, "bbb_vehicle_types", len(incident))
+
+    pedestrian_incidents = np.flatnonzero(is_pedestrian)
+    incident = np.concatenate([incident, pedestrian_incidents])
+    vehicle_type = np.concatenate([vehicle_type, np.full(len(pedestrian_incidents), lookup_id(dims, "bbb_vehicle_types", "Pieszy"))])
+    order = np.argsort(incident, kind="stable")
+    incident, vehicle_type = incident[order], vehicle_type[order]
+
+    m = len(incident)
+    rows = zip(
+        range(first_vehicle_id, first_vehicle_id + m),
+        (incident + first_id).tolist(),
+        vehicle_type.tolist(),
+        pick(rng, "bbb_vehicle_details", m).tolist(),
+        (rng.choice(N_VEHICLE_MODELS, m, p=dims["model_p"]) + 1).tolist(),
+    )
+    return list(rows), incident, vehicle_type
+
+
+def passengers_chunk(rng, dims, first_id, first_vehicle_id, first_passenger_id, incident, vehicle_type, years):
+    # one person per pedestrian and bicycle, drivers of motor vehicles sometimes carry passengers
+    on_foot = vehicle_type == lookup_id(dims, "bbb_vehicle_types", "Pieszy")
+    bicycle = vehicle_type == lookup_id(dims, "bbb_vehicle_types", "Rower")
+    n_people = np.where(on_foot | bicycle, 1, 1 + rng.binomial(2, 0.15, len(vehicle_type)))
+    vehicle = np.repeat(np.arange(len(vehicle_type)), n_people)
+    first_in_vehicle = np.ones(len(vehicle), dtype=bool)
+    first_in_vehicle[1:] = vehicle[1:] != vehicle[:-1]
+    m = len(vehicle)
+
+    passenger_type = np.where(on_foot[vehicle], lookup_id(dims, "ccc_passenger_types", "Pieszy"),
+                              np.where(first_in_vehicle, lookup_id(dims, "ccc_passenger_types", "Kierujący"), lookup_id(dims, "ccc_passenger_types", "Pasażer")))
+    driver = first_in_vehicle & ~on_foot[vehicle]
+    age = np.clip(rng.normal(42, 16, m), 3, 95).astype(np.int64)
+    age = np.where(driver, np.maximum(age, 16), age)
+    born_year = years[incident[vehicle]] - age
+    unknown_born = rng.random(m) < 0.03
+
+    # pedestrians and cyclists get hurt far more often than people inside cars
+    exposed = (on_foot | bicycle)[vehicle]
+    injury = np.where(exposed & (rng.random(m) < 0.8), rng.choice([2, 3, 4, 5], m, p=[0.55, 0.35, 0.06, 0.04]), pick(rng, "ccc_injuries", m))
+    # penalties and faults for roughly one driver per incident
+    at_fault = driver & (rng.random(m) < 0.55)
+    penalty = np.where(at_fault & (rng.random(m) < 0.85), pick(rng, "ccc_penalties", m), -1)
+    fault = np.where(at_fault, pick(rng, "ccc_faults", m), -1)
+
+    rows = zip(
+        range(first_passenger_id, first_passenger_id + m),
+        (incident[vehicle] + first_id).tolist(),
+        (vehicle + first_vehicle_id).tolist(),
+        passenger_type.tolist(),
+        [None if x else f"{y}-01-01" for x, y in zip(unknown_born.tolist(), born_year.tolist())],
+        np.where(unknown_born, None, born_year).tolist(),
+        np.where(rng.random(m) < 0.62, "M", "K").tolist(),
+        np.where(driver, pick(rng, "ccc_rights", m), None).tolist(),
+        np.where(driver, np.maximum(age - 18, 0).astype(str), None).tolist(),
+        np.where(driver, pick(rng, "ccc_under_influences", m), None).tolist(),
+        injury.tolist(),
+        np.where(penalty < 0, None, penalty).tolist(),
+        np.where(fault < 0, None, fault).tolist(),
+    )
+    return list(rows)
+
+
+def generate(db_path, n_incidents, seed=0, chunk_size=CHUNK_SIZE):
+    # writes a fresh database, then creates the indexes of db_setup.py
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    rng = np.random.default_rng(seed)
+    dims = dimensions(rng)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    for sqlstr in SCHEMA:
+        conn.execute(sqlstr)
+    for table, (key, value, _) in LOOKUPS.items():
+        conn.executemany(f"INSERT INTO {table} VALUES (?, ?)", enumerate(dims["values"][table], start=1))
+    conn.executemany("INSERT INTO aaa_districts VALUES (?, ?)", ((i + 1, f"Powiat {i + 1}") for i in range(len(dims["district_voivodeship"]))))
+    conn.executemany("INSERT INTO aaa_communes VALUES (?, ?)", ((i + 1, f"Gmina {i + 1}") for i in range(len(dims["commune_district"]))))
+
+    n_vehicles = n_passengers = 0
+    for first in range(0, n_incidents, chunk_size):
+        n = min(chunk_size, n_incidents - first)
+        incidents, type_names, is_pedestrian, years = incidents_chunk(rng, dims, first + 1, n)
+        vehicles, incident, vehicle_type = vehicles_chunk(rng, dims, first + 1, n_vehicles + 1, type_names, is_pedestrian)
+        passengers = passengers_chunk(rng, dims, first + 1, n_vehicles + 1, n_passengers + 1, incident, vehicle_type, years)
+        conn.executemany(f"INSERT INTO zzz_incidents VALUES ({', '.join(['?'] * len(incidents[0]))})", incidents)
+        conn.executemany("INSERT INTO zzz_participants VALUES (?, ?, ?, ?, ?)", vehicles)
+        conn.executemany(f"INSERT INTO zzz_passengers VALUES ({', '.join(['?'] * 13)})", passengers)
+        conn.commit()
+        n_vehicles += len(vehicles)
+        n_passengers += len(passengers)
+
+    conn.close()
+    setup_database(db_path)
+    return {"incidents": n_incidents, "participants": n_vehicles, "passengers": n_passengers}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="synthetic accidents.db with the SEWIK schema")
+    parser.add_argument("db_path")
+    parser.add_argument("--scale", default="100k", help=f"{', '.join(SCALES)} or a number of incidents")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(generate(args.db_path, SCALES.get(args.scale) or int(args.scale), args.seed))
@@ -0,0 +1,114 @@
+import importlib
+import os
+import sys
+import textwrap
+
+from pipeline import run
+
+
+# stage keys cover only the code a stage uses: editing the helper of one stage re-runs it and its
+# downstream stages, the upstream ones stay cached
+
+
+def write(path, text):
+    with open(path, "w") as f:
+        f.write(textwrap.dedent(text))
+    # same size edits within one mtime tick would reuse the cached file hash
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000_000))
+
+
+def toy_pipeline(folder):
+    write(folder / "toy_numbers.py", """
+        def double(x):
+            return 2 * x
+    """)
+    write(folder / "toy_words.py", """
+        def shout(x):
+            return f"{x}!"
+    """)
+    write(folder / "toy_stages.py", """
+        from toy_numbers import double
+        from toy_words import shout
+
+        OFFSET = 1
+
+
+        def first(inputs, outputs):
+            with open(outputs["numbers"], "w") as f:
+                f.write(str(double(OFFSET)))
+
+
+        def suffix(x):
+            return x
+
+
+        def second(inputs, outputs):
+            with open(inputs["numbers"]) as f:
+                text = f.read()
+            with open(outputs["words"], "w") as f:
+                f.write(suffix(shout(text)))
+    """)
+
+
+def toy_stages(folder):
+    # fresh imports, as in a new run of the script
+    for name in ["toy_numbers", "toy_words", "toy_stages"]:
+        sys.modules.pop(name, None)
+    importlib.invalidate_caches()
+    module = importlib.import_module("toy_stages")
+    return {
+        "first": (module.first, {}, {"numbers": str(folder / "numbers.txt")}),
+        "second": (module.second, {"numbers": str(folder / "numbers.txt")}, {"words": str(folder / "words.txt")}),
+    }
+
+
+def test_edited_helper_leaves_upstream_cached(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    toy_pipeline(tmp_path)
+    state_path = str(tmp_path / "state.json")
+    assert run(toy_stages(tmp_path), state_path=state_path) == {"first": "ran", "second": "ran"}
+    assert run(toy_stages(tmp_path), state_path=state_path) == {"first": "cached", "second": "cached"}
+
+    # helper module used by the second stage only
+    write(tmp_path / "toy_words.py", """
+        def shout(x):
+            return f"{x}!!"
+    """)
+    assert run(toy_stages(tmp_path), state_path=state_path) == {"first": "cached", "second": "ran"}
+
+    # helper function of the second stage, in the stage module
+    source = (tmp_path / "toy_stages.py").read_text()
+    write(tmp_path / "toy_stages.py", source.replace("return x\n", "return x.upper()\n"))
+    assert run(toy_stages(tmp_path), state_path=state_path) == {"first": "cached", "second": "ran"}
+
+    # constant of the first stage
+    source = (tmp_path / "toy_stages.py").read_text()
+    write(tmp_path / "toy_stages.py", source.replace("OFFSET = 1", "OFFSET = 2"))
+    assert run(toy_stages(tmp_path), state_path=state_path) == {"first": "ran", "second": "ran"}
+
+    # same output of the first stage, the second one stays cached
+    write(tmp_path / "toy_numbers.py", """
+        def double(x):
+            return x + x
+    """)
+    assert run(toy_stages(tmp_path), state_path=state_path) == {"first": "ran", "second": "cached"}
+
+
+def cached_stage(inputs, outputs):
+    # counts the runs that found their cache
+    os.makedirs(outputs["cache"], exist_ok=True)
+    hits = os.path.join(outputs["cache"], "hits")
+    with open(outputs["result"], "w") as f:
+        f.write(str(os.path.exists(hits)))
+    open(hits, "w").close()
+
+
+def test_force_clears_cache(tmp_path):
+    stages = {"fit": (cached_stage, {}, {"result": str(tmp_path / "result.txt"), "cache": str(tmp_path / "cache")})}
+    state_path = str(tmp_path / "state.json")
+    run(stages, state_path=state_path)
+    os.remove(tmp_path / "result.txt")
+    assert run(stages, state_path=state_path) == {"fit": "ran"}
+    assert (tmp_path / "result.txt").read_text() == "True"
+    assert run(stages, state_path=state_path, force=["fit"]) == {"fit": "ran"}
+    assert (tmp_path / "result.txt").read_text() == "False"
@@ -0,0 +1,94 @@
+import datetime
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from calculate_accidents_stats import involved_pedestrian_below18
+from lazy_query import scan, derive, select, collect
+from train_traffic_weather_models import month_periods, round_counts
+from weather_ingest import month_start
+
+
+# the column expressions that replaced the per-row apply lambdas give the same results as the lambdas
+
+
+def test_involved_pedestrian_below18():
+    df = pd.DataFrame({
+        "involved_pedestrian": [True, True, True, True, True, False, False, True],
+        "pedestrian_age": [np.nan, 0, 17, 18, 45, 10, np.nan, -1],
+    })
+    old = df.apply(lambda x: x["involved_pedestrian"] and x["pedestrian_age"] and x["pedestrian_age"] < 18, axis=1)
+    new = involved_pedestrian_below18(df)
+    assert new.dtype == bool
+    assert new.tolist() == [bool(x) for x in old]
+
+
+def police_db():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE zzz_incidents (incident_id INTEGER PRIMARY KEY, type_id INTEGER);
+        CREATE TABLE zzz_participants (nid INTEGER PRIMARY KEY, incident_id INTEGER, vehicle_detail_id INTEGER);
+        CREATE TABLE zzz_passengers (nid INTEGER PRIMARY KEY, incident_id INTEGER, vehicle_id INTEGER, penalty_id INTEGER, fault_id INTEGER);
+        CREATE TABLE bbb_vehicle_details (nid INTEGER PRIMARY KEY, vehicle_detail TEXT);
+        CREATE TABLE ccc_penalties (nid INTEGER PRIMARY KEY, penalty TEXT);
+        CREATE TABLE ccc_faults (nid INTEGER PRIMARY KEY, fault TEXT);
+        INSERT INTO zzz_incidents VALUES (1, 1);
+        INSERT INTO zzz_participants VALUES (1, 1, 1), (2, 1, 2), (3, 1, NULL);
+        INSERT INTO bbb_vehicle_details VALUES (1, 'Pojazd uprzywilejowany Policja'), (2, 'Samochód osobowy');
+        INSERT INTO ccc_penalties VALUES (1, 'Mandat karny'), (2, '');
+        INSERT INTO ccc_faults VALUES (1, 'Nieprawidłowe wyprzedzanie'), (2, '');
+        -- None, "" and a value for both columns, on police, other and unknown vehicles
+        INSERT INTO zzz_passengers VALUES
+            (1, 1, 1, NULL, NULL), (2, 1, 1, 2, 2), (3, 1, 2, 1, 1),
+            (4, 1, 2, NULL, 2), (5, 1, 3, 2, NULL), (6, 1, 3, 1, 1);
+    """)
+    return conn
+
+
+def test_police_columns():
+    conn = police_db()
+    raw = pd.DataFrame(conn.execute("""
+        SELECT zzz_passengers.nid, bbb_vehicle_details.vehicle_detail, ccc_penalties.penalty, ccc_faults.fault
+        FROM zzz_passengers
+        INNER JOIN zzz_participants ON zzz_passengers.vehicle_id = zzz_participants.nid
+        LEFT JOIN bbb_vehicle_details ON zzz_participants.vehicle_detail_id = bbb_vehicle_details.nid
+        LEFT JOIN ccc_penalties ON zzz_passengers.penalty_id = ccc_penalties.nid
+        LEFT JOIN ccc_faults ON zzz_passengers.fault_id = ccc_faults.nid
+        ORDER BY zzz_passengers.nid
+    """).fetchall(), columns=["nid", "vehicle_detail", "penalty", "fault"], dtype=object)
+
+    q = derive(scan("passengers"), "is_police", "vehicle_detail", "=", "Pojazd uprzywilejowany Policja")
+    q = derive(q, "fault_x", "fault", "fill", "Brak")
+    q = derive(q, "penalty_x", "penalty", "fill", "Brak")
+    df = collect(conn, select(q, ["nid", "is_police", "fault_x", "penalty_x"]), {"nid": "int64"})
+    df = df.sort_values("nid").reset_index(drop=True)
+    conn.close()
+
+    assert df["is_police"].tolist() == raw["vehicle_detail"].apply(lambda x: True if x=='Pojazd uprzywilejowany Policja' else False).tolist()
+    # is_fault only decides fault_x now
+    assert (df["fault_x"] != "Brak").tolist() == raw["fault"].apply(lambda x: True if x else False).tolist()
+    assert df["penalty_x"].tolist() == raw["penalty"].apply(lambda x: x if x else "Brak").tolist()
+    assert df["fault_x"].tolist() == raw["fault"].apply(lambda x: x if x else "Brak").tolist()
+
+
+def test_weather_period():
+    df = pd.DataFrame({"Rok": [2010, 2015, 2020, 2022], "Miesiąc": [1, 2, 12, 6]})
+    old = df.apply(lambda x: datetime.date(x["Rok"], x["Miesiąc"], 1), axis=1)
+    assert month_start(df["Rok"], df["Miesiąc"]).tolist() == old.tolist()
+
+
+def test_accidents_period():
+    df = pd.DataFrame({"date": ["2010-01-01", "2016-02-29", "2020-12-31", "2022-06-15"]})
+    old = df["date"].apply(lambda x: datetime.date(int(x.split("-")[0]), int(x.split("-")[1]), 1))
+    new = month_periods(df["date"])
+    assert new.dt.date.tolist() == old.tolist()
+    # year of the merged frame
+    assert pd.to_datetime(new.dt.date).dt.year.tolist() == new.dt.date.apply(lambda x: x.year).tolist()
+
+
+def test_round_counts():
+    x = pd.Series([0.5, 1.5, 2.5, -0.5, 2.4999, 2.5001, 103.5, 0.0])
+    old = x.apply(lambda x: int(round(x, 0)))
+    new = round_counts(x)
+    assert new.tolist() == old.tolist()
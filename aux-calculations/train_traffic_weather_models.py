@@ -1,265 +1,234 @@
 import os
-import sqlite3
+import glob
 import json
-import zipfile
-
-import datetime
+import pickle
 
 import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from weather_ingest import load_weather
+from model_zoo import evaluate_models, data_hash
+from model_store import save_model, load_model, predict_scenarios, effects_by_date
+from backtesting import SEARCH_SPACES, rolling_origin_splits, backtest_models, search
+from pipeline import cli
+from instrumentation import span, rows
+
 
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_squared_error, r2_score
-from sklearn.linear_model import LinearRegression, Ridge, Lasso, HuberRegressor
-from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
-from sklearn.svm import SVR
-from sklearn.preprocessing import StandardScaler, PolynomialFeatures
-from sklearn.pipeline import make_pipeline
-from xgboost import XGBRegressor
-from lightgbm import LGBMRegressor
-from catboost import CatBoostRegressor
-
-# get weather data
-%%time
-
-folder_path = "input/path/zips3"
-items = os.listdir(folder_path)
-files = [os.path.join(folder_path, item) for item in items if os.path.isfile(os.path.join(folder_path, item))]
-
-column_names = [
-    "Kod stacji",
-    "Nazwa stacji",
-    "Rok",
-    "Miesiąc",
-    "Absolutna temperatura maksymalna",
-    "Status pomiaru TMAX",
-    "Średnia temperatura maksymalna",
-    "Status pomiaru TMXS",
-    "Absolutna temperatura minimalna",
-    "Status pomiaru TMIN",
-    "Średnia temperatura minimalna",
-    "Status pomiaru TMNS",
-    "Średnia temperatura miesięczna",
-    "Status pomiaru STM",
-    "Minimalna temperatura przy gruncie",
-    "Status pomiaru TMNG",
-    "Miesieczna suma opadów", #mm
-    "Status pomiaru SUMM",
-    "Maksymalna dobowa suma opadów",
-    "Status pomiaru OPMX",
-    "Pierwszy dzień wystapienia opadu maksymalnego",
-    "Ostatni dzień wystąpienia opadu maksymalnego",
-    "Maksymalna wysokość pokrywy śnieżnej", #cm
-    "Status pomiaru PKSN",
-    "Liczba dni z pokrywą śnieżną",
-    "Liczba dni z opadem deszczu",
-    "Liczba dni z opadem śniegu",
-]
-
-dfs = []
-for f in [x for x in files if x.endswith(".zip")]:
-    try:
-        with zipfile.ZipFile(f, 'r') as z:
-            # Get a list of all files in the ZIP archive
-            zipped_files = z.namelist()
-            for zf in zipped_files:
-                if "k_m_d_" in zf:
-                    csv_file_name = zf
-                    break
-
-            if csv_file_name:
-                with z.open(csv_file_name) as csv_file:
-                    dfs.append(pd.read_csv(csv_file, encoding='ISO-8859-1', names=column_names))
-    except Exception as e:
-        print(e)
-
-df = pd.concat(dfs, ignore_index=True)
-df["period"] = df.apply(lambda x: datetime.date(x["Rok"], x["Miesiąc"], 1), axis=1)
-
-df_weather = df.groupby("period").agg(
-    max_temp=("Średnia temperatura maksymalna", 'mean'),
-    min_temp=("Średnia temperatura minimalna", 'mean'),
-    avg_temp=("Średnia temperatura miesięczna", 'mean'),
-    min_ground_temp=("Minimalna temperatura przy gruncie", 'mean'),
-    avg_fall=("Miesieczna suma opadów", 'mean'),
-    max_snow=("Maksymalna wysokość pokrywy śnieżnej", 'mean'),
-    snow_coverage_days=("Liczba dni z pokrywą śnieżną", 'mean'),
-    rain_fall_days=("Liczba dni z opadem deszczu", 'mean'),
-    snow_fall_days=("Liczba dni z opadem śniegu", 'mean'),
-).reset_index()
-
-
-# get accidents numbers
-df_acc = pd.read_csv("input/path/pedestrians-accidents-by-days.csv")
-df_acc["period"] = df_acc["date"].apply(lambda x: datetime.date(int(x.split("-")[0]), int(x.split("-")[1]), 1))
-df_acc = df_acc.groupby("period").agg(
-    count = ("count", 'sum')
-).reset_index()
-
-
-# get traffic data
-df_traffic = pd.read_pickle("input/path/df_traffic.pkl")
-df_traffic = df_traffic.groupby("period").agg(
-    traffic_volume = ("count", 'mean')
-).reset_index()
-
-
-# merge accidents, traffic and weather data
-df_acc = df_acc.merge(df_weather, left_on="period", right_on="period")
-df_acc = df_acc.merge(df_traffic, left_on="period", right_on="period")
-df_acc["year"] = df_acc["period"].apply(lambda x: x.year)
-
-
-# evaluate models
-variables = ["max_temp", "min_temp", "avg_temp", "min_ground_temp", "avg_fall", "max_snow", "snow_coverage_days", "rain_fall_days", "snow_fall_days", "traffic_volume"]
+VARIABLES = ["max_temp", "min_temp", "avg_temp", "min_ground_temp", "avg_fall", "max_snow", "snow_coverage_days", "rain_fall_days", "snow_fall_days", "traffic_volume"]
 # exclude years 2020-2022 - for these years predictions will be made
-df_train = df_acc[~df_acc["year"].isin([2022, 2021, 2020])]
-
-X = df_train[variables]
-y = df_train['count']
-
-X_all = df_acc[variables]
-y_all = df_acc['count']
-
-models = {
-    "Linear Regression": make_pipeline(
-        StandardScaler(),
-        LinearRegression()
-    ),
-    "Polynomial & LinearRegression": make_pipeline(
-        PolynomialFeatures(degree=2, include_bias=False),
-        StandardScaler(),
-        LinearRegression()
-    ),
-    "Ridge Regression": make_pipeline(
-        StandardScaler(),
-        Ridge()
-    ),
-    "Lasso Regression": make_pipeline(
-        StandardScaler(),
-        Lasso()
-    ),
-    "Polynomial & Ridge Regression": make_pipeline(
-        PolynomialFeatures(degree=2, include_bias=False),
-        StandardScaler(),
-        Ridge()
-    ),
-    "HuberRegressor": make_pipeline(
-        StandardScaler(),
-        HuberRegressor()
-    ),
-    "Polynomial & HuberRegressor": make_pipeline(
-        PolynomialFeatures(degree=2, include_bias=False),
-        StandardScaler(),
-        HuberRegressor()
-    ),
-    "Random Forest": make_pipeline(
-        StandardScaler(),
-        RandomForestRegressor()
-    ),
-    "Polynomial & Random Forest": make_pipeline(
-        PolynomialFeatures(degree=2, include_bias=False),
-        StandardScaler(),
-        RandomForestRegressor()
-    ),
-    "Gradient Boosting": make_pipeline(
-        StandardScaler(),
-        GradientBoostingRegressor()
-    ),
-    "Polynomial & Gradient Boosting": make_pipeline(
-        PolynomialFeatures(degree=2, include_bias=False),
-        StandardScaler(),
-        GradientBoostingRegressor()
-    ),
-    "XGBoost": make_pipeline(
-        StandardScaler(),
-        XGBRegressor()
-    ),
-    "Polynomial & XGBoost": make_pipeline(
-        PolynomialFeatures(degree=2, include_bias=False),
-        StandardScaler(),
-        XGBRegressor()
-    ),
-    "LightGBM": make_pipeline(
-        StandardScaler(),
-        LGBMRegressor(verbose=-1)
-    ),
-    "CatBoost": make_pipeline(
-        StandardScaler(),
-        CatBoostRegressor(verbose=0)
-    ),
-    "Polynomial & CatBoost": make_pipeline(
-        PolynomialFeatures(degree=2, include_bias=False),
-        StandardScaler(),
-        CatBoostRegressor(verbose=0)
-    ),
+PREDICTED_YEARS = [2022, 2021, 2020]
+
+# model -> file with the actual and predicted counts per month
+PREDICTIONS = {
+    "Random Forest": "pedestrians-random-forest-predicted-accidents-by-months.csv",
+    "Polynomial & LinearRegression": "pedestrians-linear-regression-predicted-accidents-by-months.csv",
 }
 
-results = {}
-for name, model in models.items():
-    model.fit(X, y)
-    predictions = model.predict(X_all)
-    mse = mean_squared_error(y_all, predictions)
-    r2 = r2_score(y_all, predictions)
-    results[name] = (mse, r2)
-
-# print results
-for name, (mse, r2) in results.items():
-    print(f"{name} - MSE: {mse:.2f}, R-squared: {r2:.2f}")
-
-df_acc['predicted_count'] = predictions
-
-
-
-# train RandomForest
-model = make_pipeline(
-        StandardScaler(),
-        RandomForestRegressor()
-    )
-model.fit(X, y)
-# see the results
-predictions = model.predict(df_acc[variables])
-df_acc['predicted_count'] = predictions
-plt.figure(figsize=(10, 6))
-plt.plot(df_acc['period'], df_acc['count'], label='actual count', color='blue', marker='o', linestyle='-', markersize=5)
-plt.plot(df_acc['period'], df_acc['predicted_count'], label='predicted count', color='red', marker='x', linestyle='--', markersize=5)
-plt.xlabel('date')
-plt.ylabel('count')
-plt.xticks(rotation=45)
-plt.legend()
-plt.tight_layout()
-plt.show()
-# save the results
-df_acc["predicted_count"] = df_acc["predicted_count"].apply(lambda x: int(round(x, 0)))
-df_acc[["year", "period", "count", "predicted_count"]].to_csv("output/path/pedestrians-random-forest-predicted-accidents-by-months.csv", index=False)
-
-# train Polynomial
-model = make_pipeline(
-        PolynomialFeatures(degree=2, include_bias=False),
-        StandardScaler(),
-        LinearRegression()
-    )
-model.fit(X, y)
-# see the results
-predictions = model.predict(df_acc[variables])
-df_acc['predicted_count'] = predictions
-plt.figure(figsize=(10, 6))
-plt.plot(df_acc['period'], df_acc['count'], label='actual count', color='blue', marker='o', linestyle='-', markersize=5)
-plt.plot(df_acc['period'], df_acc['predicted_count'], label='predicted count', color='red', marker='x', linestyle='--', markersize=5)
-plt.xlabel('date')
-plt.ylabel('count')
-plt.xticks(rotation=45)
-plt.legend()
-plt.tight_layout()
-plt.show()
-# save the results
-df_acc["predicted_count"] = df_acc["predicted_count"].apply(lambda x: int(round(x, 0)))
-df_acc[["year", "period", "count", "predicted_count"]].to_csv("output/path/pedestrians-linear-regression-predicted-accidents-by-months.csv", index=False)
-
-
-# calculate correlation coefficient
-df_test = df_acc[~df_acc["year"].isin([2022, 2021, 2020])]
-variables = ["max_temp", "min_temp", "avg_temp", "min_ground_temp", "avg_fall", "max_snow", "snow_coverage_days", "rain_fall_days", "snow_fall_days", "traffic_volume"]
-for var in variables:
-    correlation = df_test['count'].corr(df_test[var])
-    print(f"Correlation coefficient count / {var}:", correlation)
+# what-if inputs scored by the saved models: scenario -> {column: value or function of the column}
+SCENARIOS = {
+    "traffic +10%": {"traffic_volume": lambda x: x * 1.1},
+    "traffic -10%": {"traffic_volume": lambda x: x * 0.9},
+    "temperature +1°C": {x: (lambda y: y + 1) for x in ["max_temp", "min_temp", "avg_temp", "min_ground_temp"]},
+    "no snow": {"max_snow": 0, "snow_coverage_days": 0, "snow_fall_days": 0},
+}
+# candidate law-change dates, 2021-06-01 is the actual pedestrians' right of way change
+LAW_CHANGE_DATES = ["2020-01-01", "2020-06-01", "2021-01-01", "2021-06-01", "2022-01-01"]
+
+
+def month_periods(dates):
+    # first day of the month of every "YYYY-MM-DD" date, as timestamps
+    return pd.to_datetime(dates, format="%Y-%m-%d").dt.to_period("M").dt.to_timestamp()
+
+
+def round_counts(x):
+    # half to even, same as the built-in round
+    return np.round(x).astype(int)
+
+
+def training_data(df_acc):
+    df_train = df_acc[~df_acc["year"].isin(PREDICTED_YEARS)]
+    return df_train, df_train[VARIABLES], df_train['count'], df_acc[VARIABLES], df_acc['count']
+
+
+def weather(inputs, outputs):
+    # get weather data
+    # archives are parsed in parallel and reduced to monthly aggregates right away,
+    # unchanged archives come from the cache, failures are listed in the error report
+    df_weather, weather_errors = load_weather(inputs["zips"], outputs["cache"], outputs["errors"])
+    if weather_errors:
+        print(f"{len(weather_errors)} weather archives failed, see {outputs['errors']}")
+    rows(rows_in=len(glob.glob(os.path.join(inputs["zips"], "*.zip"))), rows_out=len(df_weather))
+    df_weather.to_pickle(outputs["weather"])
+
+
+def features(inputs, outputs):
+    # get accidents numbers
+    df_acc = pd.read_csv(inputs["accidents"])
+    rows(rows_in=len(df_acc))
+    df_acc["period"] = month_periods(df_acc["date"])
+    df_acc = df_acc.groupby("period").agg(
+        count = ("count", 'sum')
+    ).reset_index()
+    df_acc["period"] = df_acc["period"].dt.date
+
+    # get traffic data
+    df_traffic = pd.read_pickle(inputs["traffic"])
+    df_traffic = df_traffic.groupby("period").agg(
+        traffic_volume = ("count", 'mean')
+    ).reset_index()
+
+    # merge accidents, traffic and weather data
+    df_weather = pd.read_pickle(inputs["weather"])
+    df_acc = df_acc.merge(df_weather, left_on="period", right_on="period")
+    df_acc = df_acc.merge(df_traffic, left_on="period", right_on="period")
+    df_acc["year"] = pd.to_datetime(df_acc["period"]).dt.year
+    rows(rows_out=len(df_acc))
+    df_acc.to_pickle(outputs["features"])
+
+
+def train(inputs, outputs):
+    df_acc = pd.read_pickle(inputs["features"])
+    df_train, X, y, X_all, y_all = training_data(df_acc)
+    rows(rows_in=len(X), rows_out=len(X_all))
+
+    # shared preprocessing, parallel fits within a global thread budget, fitted models and scores cached
+    results, fitted = evaluate_models(X, y, X_all, y_all, cache_dir=outputs["cache"])
+    with open(outputs["models"], "wb") as f:
+        pickle.dump(fitted, f)
+
+    # the models behind the published predictions go to the model store with their metadata
+    training_hash = data_hash(X, y)
+    for name in PREDICTIONS:
+        save_model(fitted[name], name, VARIABLES, (df_train["period"].min(), df_train["period"].max()), training_hash,
+                   os.path.dirname(outputs["store"]), mse=results[name][0], r2=results[name][1])
+
+    # print results (scored over X_all, which includes the training rows)
+    for name, (mse, r2) in results.items():
+        print(f"{name} - MSE: {mse:.2f}, R-squared: {r2:.2f}")
+    pd.DataFrame([{"model": name, "mse": mse, "r2": r2} for name, (mse, r2) in results.items()]).to_csv(outputs["scores"], index=False)
+
+
+def backtest(inputs, outputs):
+    df_acc = pd.read_pickle(inputs["features"])
+    df_train, X, y, _, _ = training_data(df_acc)
+
+    # backtest - rolling-origin splits over the months before 2020, scored on held-out months only
+    splits = rolling_origin_splits(df_train["period"])
+    rows(rows_in=len(X))
+    df_backtest = backtest_models(X, y, splits)
+    for name, (mse, r2) in df_backtest[["mse", "r2"]].iterrows():
+        print(f"{name} - held-out MSE: {mse:.2f}, R-squared: {r2:.2f}")
+    df_backtest.to_csv(outputs["backtest"])
+
+
+def tune(inputs, outputs):
+    df_acc = pd.read_pickle(inputs["features"])
+    df_train, X, y, _, _ = training_data(df_acc)
+    splits = rolling_origin_splits(df_train["period"])
+
+    # hyperparameter search for the tree and boosting models - successive halving over n_estimators
+    best = {}
+    rows(rows_in=len(X))
+    for name in SEARCH_SPACES:
+        with span(f"search {name}"):
+            searcher = search(name, X, y, splits)
+        print(f"{name} - best held-out MSE: {-searcher.best_score_:.2f}, params: {searcher.best_params_}")
+        best[name] = {"mse": -searcher.best_score_, "params": searcher.best_params_}
+    with open(outputs["search"], "w") as f:
+        json.dump(best, f, indent=2, default=str)
+
+
+def predict(inputs, outputs):
+    df_acc = pd.read_pickle(inputs["features"])
+
+    rows(rows_in=len(df_acc), rows_out=len(df_acc) * len(PREDICTIONS))
+    for name, file_name in PREDICTIONS.items():
+        model, metadata = load_model(name, os.path.dirname(inputs["store"]))
+        # see the results
+        predictions = model.predict(df_acc[metadata["features"]])
+        df_acc['predicted_count'] = predictions
+        plt.figure(figsize=(10, 6))
+        plt.plot(df_acc['period'], df_acc['count'], label='actual count', color='blue', marker='o', linestyle='-', markersize=5)
+        plt.plot(df_acc['period'], df_acc['predicted_count'], label='predicted count', color='red', marker='x', linestyle='--', markersize=5)
+        plt.xlabel('date')
+        plt.ylabel('count')
+        plt.xticks(rotation=45)
+        plt.legend()
+        plt.tight_layout()
+        plt.savefig(outputs[file_name.replace(".csv", ".png")])
+        plt.close()
+        # save the results
+        df_acc["predicted_count"] = round_counts(df_acc["predicted_count"])
+        df_acc[["year", "period", "count", "predicted_count"]].to_csv(outputs[file_name], index=False)
+
+
+def counterfactuals(inputs, outputs):
+    # every scenario of every saved model in one predict call per model, no retraining
+    df_acc = pd.read_pickle(inputs["features"])
+    scenarios, effects = [], []
+    for name in PREDICTIONS:
+        model, metadata = load_model(name, os.path.dirname(inputs["store"]))
+        df_predictions = predict_scenarios(model, metadata, df_acc, SCENARIOS)
+        scenarios.append(df_predictions.assign(model=name, period=df_acc["period"], count=df_acc["count"]))
+        effects.append(effects_by_date(df_acc["period"], df_acc["count"], df_predictions, LAW_CHANGE_DATES).assign(model=name))
+    rows(rows_in=len(df_acc), rows_out=len(df_acc) * len(PREDICTIONS) * (len(SCENARIOS) + 1))
+
+    pd.concat(scenarios).melt(id_vars=["model", "period", "count"], var_name="scenario", value_name="predicted_count") \
+        .to_csv(outputs["scenarios"], index=False)
+    pd.concat(effects).to_csv(outputs["effects"], index=False)
+
+
+def correlations(inputs, outputs):
+    # calculate correlation coefficient
+    df_acc = pd.read_pickle(inputs["features"])
+    df_test = df_acc[~df_acc["year"].isin(PREDICTED_YEARS)]
+    rows(rows_in=len(df_test), rows_out=len(VARIABLES))
+    coefficients = []
+    for var in VARIABLES:
+        correlation = df_test['count'].corr(df_test[var])
+        print(f"Correlation coefficient count / {var}:", correlation)
+        coefficients.append({"variable": var, "correlation": correlation})
+    pd.DataFrame(coefficients).to_csv(outputs["correlations"], index=False)
+
+
+def stages(input_path="input/path", output_path="output/path", accidents_path=None):
+    work_path = os.path.join(output_path, ".pipeline")
+    weather_path = os.path.join(work_path, "weather.pkl")
+    features_path = os.path.join(work_path, "features.pkl")
+    models_path = os.path.join(work_path, "models.pkl")
+    store_index = os.path.join(output_path, "models", "index.json")
+    return {
+        "weather": (weather, {"zips": os.path.join(input_path, "zips3")}, {
+            "weather": weather_path,
+            "cache": os.path.join(work_path, "weather-cache"),
+            "errors": os.path.join(output_path, "weather-ingest-errors.json"),
+        }),
+        "features": (features, {
+            "accidents": accidents_path or os.path.join(input_path, "pedestrians-accidents-by-days.csv"),
+            "traffic": os.path.join(input_path, "df_traffic.pkl"),
+            "weather": weather_path,
+        }, {"features": features_path}),
+        "train": (train, {"features": features_path}, {
+            "models": models_path,
+            "store": store_index,
+            "scores": os.path.join(output_path, "model-scores.csv"),
+            "cache": os.path.join(work_path, "model-cache"),
+        }),
+        "backtest": (backtest, {"features": features_path}, {"backtest": os.path.join(output_path, "model-backtest.csv")}),
+        "tune": (tune, {"features": features_path}, {"search": os.path.join(output_path, "model-search.json")}),
+        "predict": (predict, {"features": features_path, "store": store_index}, {
+            x: os.path.join(output_path, x) for file_name in PREDICTIONS.values() for x in (file_name, file_name.replace(".csv", ".png"))
+        }),
+        "counterfactuals": (counterfactuals, {"features": features_path, "store": store_index}, {
+            "scenarios": os.path.join(output_path, "pedestrians-counterfactual-predictions-by-months.csv"),
+            "effects": os.path.join(output_path, "pedestrians-counterfactual-effects.csv"),
+        }),
+        "correlations": (correlations, {"features": features_path}, {"correlations": os.path.join(output_path, "correlations.csv")}),
+    }
+
+
+if __name__ == "__main__":
+    cli(stages(), "traffic / weather models for pedestrian accidents")
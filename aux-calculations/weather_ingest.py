@@ -0,0 +1,139 @@
+import hashlib
+import inspect
+import json
+import os
+import traceback
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+
+# IMGW monthly climate data (k_m_d_*), columns in file order with their dtypes
+COLUMNS = {
+    "Kod stacji": "int64",
+    "Nazwa stacji": "str",
+    "Rok": "int64",
+    "Miesiąc": "int64",
+    "Absolutna temperatura maksymalna": "float64",
+    "Status pomiaru TMAX": "str",
+    "Średnia temperatura maksymalna": "float64",
+    "Status pomiaru TMXS": "str",
+    "Absolutna temperatura minimalna": "float64",
+    "Status pomiaru TMIN": "str",
+    "Średnia temperatura minimalna": "float64",
+    "Status pomiaru TMNS": "str",
+    "Średnia temperatura miesięczna": "float64",
+    "Status pomiaru STM": "str",
+    "Minimalna temperatura przy gruncie": "float64",
+    "Status pomiaru TMNG": "str",
+    "Miesieczna suma opadów": "float64", #mm
+    "Status pomiaru SUMM": "str",
+    "Maksymalna dobowa suma opadów": "float64",
+    "Status pomiaru OPMX": "str",
+    "Pierwszy dzień wystapienia opadu maksymalnego": "str",
+    "Ostatni dzień wystąpienia opadu maksymalnego": "str",
+    "Maksymalna wysokość pokrywy śnieżnej": "float64", #cm
+    "Status pomiaru PKSN": "str",
+    "Liczba dni z pokrywą śnieżną": "float64",
+    "Liczba dni z opadem deszczu": "float64",
+    "Liczba dni z opadem śniegu": "float64",
+}
+
+# monthly aggregates used by the models: name -> source column (averaged over stations)
+AGGREGATES = {
+    "max_temp": "Średnia temperatura maksymalna",
+    "min_temp": "Średnia temperatura minimalna",
+    "avg_temp": "Średnia temperatura miesięczna",
+    "min_ground_temp": "Minimalna temperatura przy gruncie",
+    "avg_fall": "Miesieczna suma opadów",
+    "max_snow": "Maksymalna wysokość pokrywy śnieżnej",
+    "snow_coverage_days": "Liczba dni z pokrywą śnieżną",
+    "rain_fall_days": "Liczba dni z opadem deszczu",
+    "snow_fall_days": "Liczba dni z opadem śniegu",
+}
+
+# cached partial aggregates of every archive and the list of archives that failed, next to the pipeline outputs
+CACHE_DIR = "output/path/.pipeline/weather-cache"
+ERROR_REPORT = "output/path/weather-ingest-errors.json"
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def reduce_station_file(csv_file):
+    # per (year, month) sums and counts, so means over all stations can be combined across archives exactly
+    df = pd.read_csv(csv_file, encoding='ISO-8859-1', names=list(COLUMNS), dtype=COLUMNS)
+    sources = list(AGGREGATES.values())
+    grouped = df.groupby(["Rok", "Miesiąc"])[sources]
+    df_sums = grouped.sum().add_suffix(" sum")
+    df_counts = grouped.count().add_suffix(" count")
+    return df_sums.join(df_counts).reset_index()
+
+
+def cache_version():
+    # the cached aggregates depend on the columns read, the aggregates and the reduction, not only on the ZIP
+    config = repr((COLUMNS, AGGREGATES, inspect.getsource(reduce_station_file)))
+    return hashlib.sha256(config.encode()).hexdigest()[:16]
+
+
+def ingest_archive(path, cache_dir):
+    # returns (monthly partial aggregates or None, error or None), cached by the hash of the ZIP and cache_version()
+    try:
+        cache_path = os.path.join(cache_dir, f"{file_hash(path)}-{cache_version()}.pkl")
+        if os.path.exists(cache_path):
+            return pd.read_pickle(cache_path), None
+
+        parts = []
+        with zipfile.ZipFile(path, 'r') as z:
+            for zf in z.namelist():
+                if "k_m_d_" in zf:
+                    with z.open(zf) as csv_file:
+                        parts.append(reduce_station_file(csv_file))
+        if not parts:
+            return None, {"file": path, "error": "FileNotFoundError", "message": "no k_m_d_ file in the archive"}
+
+        df = pd.concat(parts, ignore_index=True)
+        df.to_pickle(cache_path)
+        return df, None
+    except Exception as e:
+        return None, {"file": path, "error": type(e).__name__, "message": str(e), "traceback": traceback.format_exc()}
+
+
+def month_start(year, month):
+    # datetime.date of the first day of every month
+    return pd.to_datetime(pd.DataFrame({"year": year, "month": month, "day": 1})).dt.date
+
+
+def load_weather(folder_path, cache_dir=CACHE_DIR, error_report=ERROR_REPORT, max_workers=None):
+    files = sorted(
+        os.path.join(folder_path, item) for item in os.listdir(folder_path)
+        if item.endswith(".zip") and os.path.isfile(os.path.join(folder_path, item))
+    )
+    if not files:
+        raise FileNotFoundError(f"no weather archives (*.zip) in {folder_path}")
+    os.makedirs(cache_dir, exist_ok=True)
+
+    parts, errors = [], []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for df, error in executor.map(ingest_archive, files, [cache_dir] * len(files)):
+            if df is not None:
+                parts.append(df)
+            if error is not None:
+                errors.append(error)
+
+    with open(error_report, "w") as f:
+        json.dump({"archives": len(files), "failed": len(errors), "errors": errors}, f, indent=2, ensure_ascii=False)
+
+    df = pd.concat(parts, ignore_index=True).groupby(["Rok", "Miesiąc"]).sum().reset_index()
+    df_weather = pd.DataFrame({
+        "period": month_start(df["Rok"], df["Miesiąc"]),
+    })
+    for name, source in AGGREGATES.items():
+        df_weather[name] = df[f"{source} sum"] / df[f"{source} count"]
+    return df_weather.sort_values("period").reset_index(drop=True), errors
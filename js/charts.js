@@ -1,5 +1,25 @@
-export function load_accident_counts_by_months(data_url, div_id, settings) {
-  d3.csv(data_url).then(function(data) {
+const gzip_json_cache = {};
+
+// pre-rolled slices from aux-calculations/build_cube.py, gzip-compressed JSON
+function load_gzip_json(data_url) {
+  if (!(data_url in gzip_json_cache)) {
+    gzip_json_cache[data_url] = fetch(data_url)
+      .then(response => new Response(response.body.pipeThrough(new DecompressionStream("gzip"))).json());
+  }
+  return gzip_json_cache[data_url];
+}
+
+function load_monthly_slice(data_url, series) {
+  return load_gzip_json(data_url).then(function(data) {
+      const periods = data.periods.map(d => d3.timeParse("%Y-%m")(d));
+      const data_counts = periods.map((period, i) => ({period: period, count: data.series[series].count[i]}));
+      const data_rolling = periods.map((period, i) => ({period: period, rolling_avg: data.series[series].rolling_avg[i]}));
+      return [data_counts, data_rolling];
+  });
+}
+
+function load_daily_csv_by_months(data_url) {
+  return d3.csv(data_url).then(function(data) {
       // load data
       data.forEach(function(d) {
           d.date = d3.isoParse(d.date);
@@ -26,7 +46,18 @@ export function load_accident_counts_by_months(data_url, div_id, settings) {
               return {period: d.period, rolling_avg: sum / 12};
           }
       });
+      return [data_counts, data_rolling];
+  });
+}
+
 
+export function load_accident_counts_by_months(data_url, div_id, settings) {
+  // monthly slice (.json.gz, series = div_id) or daily csv rolled up to months in the browser,
+  // the daily csv next to the slice is the fallback until the slice is published
+  const data_loader = data_url.endsWith(".json.gz")
+    ? load_monthly_slice(data_url, div_id).catch(() => load_daily_csv_by_months(data_url.replace("accidents-by-months.json.gz", div_id + "-by-days.csv")))
+    : load_daily_csv_by_months(data_url);
+  data_loader.then(function([data_counts, data_rolling]) {
       // svg setup
       const container = document.getElementById(div_id);
       const margin = {top: 20, right: 50, bottom: 30, left: 40},
@@ -238,25 +269,49 @@ export function unload_accident_counts_by_months(div_id, callback) {
 
 
 
-export function load_accident_counts_by_days(data_url, div_id, highlighted_year, settings) {
+const daily_series_cache = {};
+
+// day-of-year aggregates from aux-calculations/daily_series.py - json manifest + little-endian typed arrays
+function load_daily_series(manifest_url) {
+  if (!(manifest_url in daily_series_cache)) {
+    const fetch_ok = url => fetch(url).then(response => {
+        if (!response.ok) {throw new Error(url + ": " + response.status);}
+        return response;
+    });
+    daily_series_cache[manifest_url] = Promise.all([
+        fetch_ok(manifest_url).then(response => response.json()),
+        fetch_ok(manifest_url.replace(/\.json$/, ".bin")).then(response => response.arrayBuffer()),
+    ]);
+  }
+  return daily_series_cache[manifest_url];
+}
+
+function load_daily_binary_by_days(manifest_url, series) {
+  return load_daily_series(manifest_url).then(function([manifest, buffer]) {
+      const info = manifest.arrays[series + "/doy_rolling"];
+      const values = new Float32Array(buffer, info.offset, info.shape[0] * info.shape[1]);
+      return manifest.years.map((year, i) => ({
+          year,
+          days: Array.from(values.subarray(i * 366, (i + 1) * 366), (count, dayOfYear) => ({dayOfYear: dayOfYear + 1, count}))
+              .filter(d => !isNaN(d.count))
+      }));
+  });
+}
+
+function load_daily_csv_by_days(data_url) {
   function parseDate(d) {
       const parsed = d3.timeParse("%Y-%m-%d")(d);
       if (parsed.getMonth() === 1 && parsed.getDate() === 29) {return null;}
       return parsed;
   }
 
-  function dayOfYearToDate(dayOfYear) {
-      var date = new Date(2021, 0);
-      return new Date(date.setDate(dayOfYear));
-  }
-
-  d3.csv(data_url).then(function(data) {
+  return d3.csv(data_url).then(function(data) {
       const filteredData = data.map(d => ({
           date: parseDate(d.date),
           count: +d.count
       })).filter(d => d.date !== null);
 
-      const data_rolling = d3.groups(filteredData, d => d.date.getFullYear(), d => d3.timeFormat("%j")(d.date))
+      return d3.groups(filteredData, d => d.date.getFullYear(), d => d3.timeFormat("%j")(d.date))
           .map(([year, days]) => ({
               year,
               days: days.map(([dayOfYear, entries], index, arr) => {
@@ -277,6 +332,22 @@ export function load_accident_counts_by_days(data_url, div_id, highlighted_year,
                   };
               })
           }));
+  });
+}
+
+
+export function load_accident_counts_by_days(data_url, div_id, highlighted_year, settings) {
+  function dayOfYearToDate(dayOfYear) {
+      var date = new Date(2021, 0);
+      return new Date(date.setDate(dayOfYear));
+  }
+
+  // pre-rolled binary (.json manifest, series = div_id) or the daily csv rolled in the browser,
+  // the daily csv is the fallback until the binary is published
+  const data_loader = data_url.endsWith(".json")
+    ? load_daily_binary_by_days(data_url, div_id).catch(() => load_daily_csv_by_days(data_url.replace("accidents-by-days.json", div_id + "-by-days.csv")))
+    : load_daily_csv_by_days(data_url);
+  data_loader.then(function(data_rolling) {
       data_rolling.forEach(yearData => {
           yearData.days.forEach(d => {
               d.date = dayOfYearToDate(d.dayOfYear);